@@ -0,0 +1,104 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+import time
+
+
+class ConnectionManager(object):
+    # Keeps an LPF2 device (SpikePrimeDevice or MindstromsDevice) connected to the hub.
+    # A connected hub sends a NACK about every 100 ms. When nothing has been received for `timeout`
+    # ms (hub reset, cable unplugged) or a write failed, the link is dropped and the handshake is
+    # repeated at once; a handshake without ACK is retried after `min_backoff` ms, doubling up to
+    # `max_backoff` ms. start() runs this in a background thread, so that the recognition loop never
+    # waits for a handshake; without _thread, call poll() from the loop instead. poll() then runs a
+    # due handshake inline, which blocks the caller for about 2.5 s per attempt (the line break and
+    # the wait for the ACK), at most once per backoff period while the hub does not answer.
+    POLL_PERIOD = 50  # ms
+
+    def __init__(self, device, timeout=1000, min_backoff=100, max_backoff=5000, on_connect=None):
+        self.device = device
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.on_connect = on_connect
+        self.backoff = min_backoff
+        self.next_attempt_ticks = time.ticks_ms()
+        self.running = False
+        self.threaded = False
+        self.attempts = 0  # handshakes
+        self.connects = 0  # handshakes answered with ACK
+        self.reconnects = 0  # of them after a lost link
+        self.lost = 0  # links dropped after a timeout or a failed write
+        self.timeouts = 0
+
+    def start(self, use_thread=True):
+        # returns True if the manager runs in its own thread
+        self.running = True
+        if use_thread and _thread is not None:
+            self.threaded = True
+            _thread.start_new_thread(self._run, ())
+        return self.threaded
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            self.poll()
+            time.sleep_ms(self.POLL_PERIOD)
+
+    def poll(self):
+        # one step of the state machine; returns True while connected
+        device = self.device
+        now = time.ticks_ms()
+        if device.connected:
+            if time.ticks_diff(now, device.last_receive_ticks) <= self.timeout:
+                return True
+            self.timeouts += 1
+            self._drop(now)
+        elif self.next_attempt_ticks is None:
+            # no attempt is due while connected, so a write has failed
+            self._drop(now)
+
+        if time.ticks_diff(now, self.next_attempt_ticks) < 0:
+            return False
+
+        self.attempts += 1
+        device.disconnect()
+        if device.initialize():
+            if self.connects > 0:
+                self.reconnects += 1
+            self.connects += 1
+            self.backoff = self.min_backoff
+            self.next_attempt_ticks = None
+            if self.on_connect is not None:
+                self.on_connect(self)
+            return True
+
+        device.disconnect()
+        self.next_attempt_ticks = time.ticks_add(time.ticks_ms(), self.backoff)
+        self.backoff = min(self.backoff * 2, self.max_backoff)
+        return False
+
+    def _drop(self, now):
+        self.lost += 1
+        self.device.disconnect()
+        # the first handshake after a lost link is immediate
+        self.backoff = self.min_backoff
+        self.next_attempt_ticks = now
@@ -0,0 +1,515 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# LPF2 (LEGO Powered Up) UART protocol: message builders, mode descriptors and the part of a device
+# that is the same for every sensor it emulates (LPF2Device).
+# See https://github.com/GianCann/technical-info/blob/master/uart-protocol.md
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+import time
+
+from link_stats import LinkStats
+
+
+MESSAGE_SYS = 0x00
+MESSAGE_CMD = 0x40
+MESSAGE_INFO = 0x80
+MESSAGE_DATA = 0xC0
+
+SYS_SYNC = 0x00
+SYS_NACK = 0x02
+SYS_ACK = 0x04
+
+CMD_TYPE = 0x00
+CMD_MODES = 0x01
+CMD_SPEED = 0x02
+CMD_SELECT = 0x03
+CMD_WRITE = 0x04
+CMD_EXT_MODE = 0x06
+CMD_VERSION = 0x07
+
+INFO_NAME = 0x00
+INFO_RAW = 0x01
+INFO_PCT = 0x02
+INFO_SI = 0x03
+INFO_SYMBOL = 0x04
+INFO_MAPPING = 0x05
+INFO_MODE_PLUS_8 = 0x20
+INFO_FORMAT = 0x80
+
+DATA8 = 0x00
+DATA16 = 0x01
+DATA32 = 0x02
+DATAF = 0x03
+
+
+def get_checksum(values):
+    checksum = 0xFF
+    for x in values:
+        checksum ^= x
+    return checksum
+
+
+def _padded(data, min_size=1):
+    # payloads are 1, 2, 4, 8, 16 or 32 bytes long; returns (length code, zero padded payload)
+    code = 0
+    while (1 << code) < max(len(data), min_size):
+        code += 1
+    return code, bytes(data) + bytes((1 << code) - len(data))
+
+
+def message(message_type, cmd, payload):
+    code, payload = _padded(payload)
+    msg = bytearray([message_type | (code << 3) | (cmd & 0x07)])
+    msg.extend(payload)
+    msg.append(get_checksum(msg))
+    return msg
+
+
+def cmd_message(cmd, payload):
+    return message(MESSAGE_CMD, cmd, payload)
+
+
+def info_message(mode, info_type, payload):
+    code, payload = _padded(payload)
+    if mode >= 8:
+        info_type |= INFO_MODE_PLUS_8
+    msg = bytearray([MESSAGE_INFO | (code << 3) | (mode & 0x07), info_type])
+    msg.extend(payload)
+    msg.append(get_checksum(msg))
+    return msg
+
+
+def data_message(mode, data_type, values, ext_mode=False):
+    # DATA message carrying values in the given format. For modes 8 and above (or always, when
+    # ext_mode is True) it is preceded by the EXT_MODE command selecting the mode bank.
+    if data_type == DATAF:
+        payload = struct.pack("<" + "f" * len(values), *values)
+    else:
+        mask = (0xFF, 0xFFFF, 0xFFFFFFFF)[data_type]
+        payload = struct.pack("<" + "BHI"[data_type] * len(values), *[int(x) & mask for x in values])
+
+    msg = message(MESSAGE_DATA, mode, payload)
+    if ext_mode or mode >= 8:
+        return cmd_message(CMD_EXT_MODE, bytes([mode & 0x08])) + msg
+    return msg
+
+
+# largest value of DATA8, DATA16 and DATA32, which the hub reads as signed
+INT_MAX = (0x7F, 0x7FFF, 0x7FFFFFFF)
+
+
+def result_values(result, data_type, count):
+    # (class, distance, runner-up class, frame counter, region) for an array mode, cut or padded
+    # with zeros to its size. In integer formats the distance is sent in hundredths (100 when no
+    # class is within SEARCH_THRESHOLD) and the values are clamped to 0..INT_MAX of the format,
+    # except the frame counter, which wraps around within it
+    values = list(result[:count])
+    if data_type != DATAF:
+        top = INT_MAX[data_type]
+        for i in range(len(values)):
+            x = values[i]
+            if i == 1:
+                x = x * 100
+            if i == 3:
+                values[i] = int(x) & top
+            else:
+                values[i] = min(top, max(0, int(x)))
+    while len(values) < count:
+        values.append(0)
+    return values
+
+
+class Mode(object):
+    # Descriptor of one sensor mode, as announced by the INFO messages of the handshake.
+    # format: (data sets, DATA8/DATA16/DATA32/DATAF, figures, decimals)
+    # flags: 6 extra bytes appended to the name (used by the MINDSTORMS hub), or None
+    def __init__(self, name, raw=(0.0, 100.0), pct=(0.0, 100.0), si=(0.0, 100.0), symbol="",
+            mapping=(0x00, 0x00), format=(1, DATA8, 3, 0), flags=None):
+        self.name = name
+        self.raw = raw
+        self.pct = pct
+        self.si = si
+        self.symbol = symbol
+        self.mapping = mapping
+        self.format = format
+        self.flags = flags
+
+    def data_sets(self):
+        return self.format[0]
+
+    def data_type(self):
+        return self.format[1]
+
+    def info_messages(self, mode):
+        name = self.name.encode()
+        if self.flags is not None:
+            name = name + bytes(6 - len(name)) + bytes(self.flags)
+
+        return [
+            info_message(mode, INFO_NAME, name),
+            info_message(mode, INFO_RAW, struct.pack("<ff", self.raw[0], self.raw[1])),
+            info_message(mode, INFO_PCT, struct.pack("<ff", self.pct[0], self.pct[1])),
+            info_message(mode, INFO_SI, struct.pack("<ff", self.si[0], self.si[1])),
+            info_message(mode, INFO_SYMBOL, self.symbol.encode()),
+            info_message(mode, INFO_MAPPING, bytes(self.mapping)),
+            info_message(mode, INFO_FORMAT, bytes(self.format)),
+        ]
+
+
+class Handshake(object):
+    # The whole handshake serialized into one buffer. Writes are only split where the
+    # protocol needs a pause (after the header and between modes).
+    def __init__(self):
+        self.buffer = bytearray()
+        self.pauses = []
+
+    def add(self, data):
+        self.buffer.extend(data)
+
+    def pause(self, ms):
+        if ms > 0:
+            self.pauses.append((len(self.buffer), ms))
+
+    def write(self, uart):
+        view = memoryview(self.buffer)
+        start = 0
+        for end, ms in self.pauses:
+            if end > start:
+                uart.write(view[start:end])
+                start = end
+            time.sleep_ms(ms)
+        if start < len(self.buffer):
+            uart.write(view[start:])
+
+
+def build_handshake(type_id, modes, mode_counts, speed, fw_version, hw_version,
+        preamble=b"", preamble_pause_ms=0, header_pause_ms=0, mode_pause_ms=0, trailer=()):
+    # mode_counts: (modes, views) or (modes, views, ext modes, ext views) for CMD_MODES
+    handshake = Handshake()
+    if preamble:
+        handshake.add(preamble)
+        handshake.pause(preamble_pause_ms)
+
+    handshake.add(cmd_message(CMD_TYPE, bytes([type_id])))
+    handshake.add(cmd_message(CMD_MODES, bytes([n - 1 for n in mode_counts])))
+    handshake.add(cmd_message(CMD_SPEED, struct.pack("<I", speed)))
+    handshake.add(cmd_message(CMD_VERSION, struct.pack("<II", fw_version, hw_version)))
+    handshake.pause(header_pause_ms)
+
+    for mode in range(len(modes) - 1, -1, -1):
+        for msg in modes[mode].info_messages(mode):
+            handshake.add(msg)
+        handshake.pause(mode_pause_ms)
+
+    for msg in trailer:
+        handshake.add(msg)
+    handshake.add(bytes([SYS_ACK]))
+    return handshake
+
+
+class MessageParser(object):
+    # Incremental parser of the messages sent by the hub (SYS, SELECT, EXT_MODE, WRITE, DATA ...).
+    # Bytes are pulled from the UART in bulk into a ring buffer; next() returns the header of the
+    # next complete message whose checksum is valid, or -1 if no complete message is buffered yet.
+    # Nothing blocks and nothing is allocated per byte. The payload of the last message is in
+    # payload[:payload_size]; for DATA messages `mode` includes the preceding EXT_MODE offset.
+    def __init__(self, size=64):
+        self.buffer = bytearray(size)
+        self.rx = bytearray(size)
+        self.head = 0
+        self.count = 0
+        self.payload = bytearray(32)
+        self.payload_size = 0
+        self.ext_mode = 0
+        self.mode = 0
+        self.checksum_errors = 0
+        self.overflows = 0
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.ext_mode = 0
+
+    def feed(self, data, n=None):
+        if n is None:
+            n = len(data)
+        buf = self.buffer
+        size = len(buf)
+        for i in range(n):
+            if self.count == size:
+                # drop the oldest byte
+                self.head = (self.head + 1) % size
+                self.count -= 1
+                self.overflows += 1
+            buf[(self.head + self.count) % size] = data[i]
+            self.count += 1
+
+    def read_from(self, uart):
+        n = uart.any()
+        if n <= 0:
+            return 0
+        free = len(self.buffer) - self.count
+        if n > free:
+            n = free
+        if n <= 0:
+            return 0
+        n = uart.readinto(self.rx, n)
+        if not n:
+            return 0
+        self.feed(self.rx, n)
+        return n
+
+    def _drop(self, n):
+        self.head = (self.head + n) % len(self.buffer)
+        self.count -= n
+
+    def next(self):
+        buf = self.buffer
+        size = len(buf)
+        while self.count > 0:
+            header = buf[self.head]
+            message_type = header & 0xC0
+            if message_type == MESSAGE_SYS:
+                self._drop(1)
+                self.payload_size = 0
+                return header
+
+            length = 1 << ((header >> 3) & 0x07)
+            if length > 32:
+                # no such message: garbage or a lost byte
+                self.checksum_errors += 1
+                self._drop(1)
+                continue
+            offset = 2 if message_type == MESSAGE_INFO else 1
+            total = offset + length + 1
+            if self.count < total:
+                return -1
+
+            checksum = 0xFF
+            for i in range(total - 1):
+                checksum ^= buf[(self.head + i) % size]
+            if checksum != buf[(self.head + total - 1) % size]:
+                # resynchronize on the next byte
+                self.checksum_errors += 1
+                self._drop(1)
+                continue
+
+            payload = self.payload
+            for i in range(length):
+                payload[i] = buf[(self.head + offset + i) % size]
+            self.payload_size = length
+            self._drop(total)
+
+            if message_type == MESSAGE_CMD and header & 0x07 == CMD_EXT_MODE:
+                self.ext_mode = payload[0]
+            elif message_type == MESSAGE_DATA:
+                self.mode = (header & 0x07) + self.ext_mode
+            return header
+
+        return -1
+
+
+class LPF2Device(object):
+    # What SpikePrimeDevice (LPF2.py) and MindstromsDevice (LPF2_mindstorms.py) share: the values
+    # to send, the keep-alive timer callback that parses the messages of the hub and answers them,
+    # and the statistics of the link. The subclasses set up the pins and the UART, do the handshake
+    # in initialize() and hand the keep-alive Timer to _start() once connected. With ext_mode every
+    # DATA message is preceded by CMD_EXT_MODE.
+    ext_mode = False
+
+    def __init__(self, modes, handshake, diagnostic_mode, keepalive_period, low_latency):
+        self.connected = False
+        self.modes = modes
+        self.handshake = handshake
+        self.diagnostic_mode = diagnostic_mode  # sent as LinkStats.values() when selected
+        self.uart = None
+        self.timer = None
+        self.data = 0
+        self.result = [0, 0.0, 0, 0, 0]  # class, distance, runner-up class, frame counter, region
+        self.data_ticks = 0
+        self.data_pending = False
+        self.last_send_ticks = 0
+        self.latency_us = 0
+        self.last_receive_ticks = 0  # ms; the hub sends a NACK about every 100 ms while connected
+        self.nacks = 0
+        self.dropped_frames = 0  # results set while not connected
+        self.keepalive_period = keepalive_period
+        self.low_latency = low_latency  # send on set_data() instead of waiting for the timer
+        self.current_mode = 0
+        self.textBuffer = bytearray(b'             ')
+        self.parser = MessageParser()
+        self.stats = LinkStats(self.parser)
+
+    def _start(self, timer):
+        # the link runs at its final speed: sends the first value and starts the keep-alive timer
+        self.set_data(0)
+        self.parser.reset()
+        self.stats.connected()
+        self.last_receive_ticks = time.ticks_ms()
+        self.timer = timer
+        timer.start()
+
+    def disconnect(self):
+        # stops the keep-alive timer and releases the UART, e.g. before a new handshake. It may run
+        # in the thread of the ConnectionManager while the loop or the timer sends, so these take
+        # self.uart once and skip the write when it is gone
+        self.connected = False
+        if self.timer is not None:
+            self.timer.deinit()
+            self.timer = None
+        uart = self.uart
+        self.uart = None
+        if uart is not None:
+            uart.deinit()
+
+    def _wait_for_value(self, expected_value, timeout=2):
+        starttime = time.time()
+        currenttime = starttime
+        status = False
+        #count = 0
+        while (currenttime - starttime) < timeout:
+            time.sleep_ms(5)
+            #print(count)
+            #count += 1
+            currenttime = time.time()
+            if self.uart.any() > 0:
+                data = self.uart.readchar()
+                #print(data)
+                if data == ord(expected_value):
+                    status = True
+                    break
+        return status
+
+    def set_data(self, data):
+        if data == self.data:
+            return
+        self.data = data
+        self._changed(False)
+
+    def set_result(self, class_num, distance, runner_up=0, frame=0, region=0):
+        # sent in the array modes, so that one read on the hub gets all of them
+        if not self.connected:
+            self.dropped_frames += 1
+        result = self.result
+        if result[0] == class_num and result[1] == distance and result[2] == runner_up and result[3] == frame \
+                and result[4] == region:
+            return
+        result[0] = class_num
+        result[1] = distance
+        result[2] = runner_up
+        result[3] = frame
+        result[4] = region
+        self._changed(True)
+
+    def _current_mode_info(self):
+        if self.current_mode < len(self.modes):
+            return self.current_mode, self.modes[self.current_mode]
+        return 0, self.modes[0]
+
+    def _changed(self, is_result):
+        # only a change of what the current mode sends is pending; the diagnostic mode is sent as is
+        info = self._current_mode_info()[1]
+        if info is self.diagnostic_mode or is_result != (info.data_sets() > 1):
+            return
+        self.data_ticks = time.ticks_us()
+        self.data_pending = True
+        if self.low_latency and self.connected:
+            self._transmit()
+
+    def _transmit(self):
+        size = self._send_value()
+        if size is None:
+            return
+        now = time.ticks_us()
+        if self.data_pending:
+            self.latency_us = time.ticks_diff(now, self.data_ticks)
+            self.stats.latency_us.add(self.latency_us)
+            self.data_pending = False
+        self.last_send_ticks = now
+        if not size:
+            self.connected = False
+
+    def _send_value(self):
+        # None when there is no UART (released by disconnect())
+        uart = self.uart
+        if uart is None:
+            return None
+        mode, info = self._current_mode_info()
+        if info is self.diagnostic_mode:
+            values = self.stats.values()
+        elif info.data_sets() > 1:
+            values = result_values(self.result, info.data_type(), info.data_sets())
+        else:
+            values = (self.data,)
+        msg = data_message(mode, info.data_type(), values, self.ext_mode)
+        size = uart.write(msg)
+        self.stats.sent(len(msg), size)
+        return size
+
+    def _handle_message_callback(self, timer):
+        uart = self.uart
+        if not self.connected or uart is None:
+            return
+
+        start = time.ticks_us()
+        stats = self.stats
+        nack = False
+        parser = self.parser
+        while True:
+            received = parser.read_from(uart)
+            if received:
+                self.last_receive_ticks = time.ticks_ms()
+                stats.bytes_received += received
+            header = parser.next()
+            if header < 0:
+                if not received:
+                    break
+            elif header == SYS_SYNC:
+                pass
+            elif header == SYS_NACK:
+                nack = True
+                self.nacks += 1
+                stats.nacks += 1
+            elif header == 0x43:  # SELECT
+                if parser.payload[0] != self.current_mode:
+                    stats.mode_switches += 1
+                self.current_mode = parser.payload[0]
+            elif header == 0x46:  # EXT_MODE, followed by a DATA message
+                pass
+            elif header & 0xC0 == MESSAGE_DATA:
+                for i in range(len(self.textBuffer)):
+                    self.textBuffer[i] = ord(b' ')
+                for i in range(min(parser.payload_size, len(self.textBuffer))):
+                    self.textBuffer[i] = parser.payload[i]
+                print(self.textBuffer)
+            elif header == 0x4C:  # WRITE, ex: 4C 20 00 93
+                pass
+            else:
+                stats.unexpected += 1
+                stats.last_unexpected = header
+
+        if nack:
+            stats.nacked()
+
+        # in low latency mode the value is already sent by set_data(); here only answer the hub's
+        # NACK, or keep the link alive if nothing has been sent for a while
+        if not self.low_latency or nack or \
+                time.ticks_diff(time.ticks_us(), self.last_send_ticks) >= self.keepalive_period * 500:
+            self._transmit()
+        stats.callback_us.add(time.ticks_diff(time.ticks_us(), start))
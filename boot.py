@@ -14,20 +14,32 @@
 # limitations under the License.
 
 import audio
-import gc
 import image
 import lcd
 import sensor
 import sys
 import time
 import uos
-import os
 from fpioa_manager import *
 from machine import I2C
 from Maix import I2S, GPIO
 import KPU as kpu
-import math
 from LPF2_mindstorms import MindstromsDevice
+from LPF2_connection import ConnectionManager
+from feature_cache import FeatureCache
+from matcher import QUANT_INT8, ClassIndex, FeatureMatcher, pack_matcher
+from class_thresholds import ClassThresholds
+from feature_extractor import FeatureExtractor
+from heap_monitor import HeapMonitor
+from frame_profiler import FrameProfiler
+from pipeline import ForwardPipeline
+from scene_change import SceneChangeDetector
+from smoothing import DecisionFilter
+from enrollment import Enroller
+from window_scheduler import WindowScheduler, grid_windows
+from session_log import SETTINGS, SessionLog, next_session_path
+
+boot_ticks = time.ticks_ms()
 
 
 IMAGES_DIR = "/sd/images"
@@ -35,8 +47,63 @@ STARTUP_IMAGE = "/sd/startup.jpg"
 CAMERA_MODE_IMAGE = "/sd/camera.jpg"
 SHUTTER_SOUND = "/sd/kacha.wav"
 FEATURE_MODEL = "/sd/model/mbnet751_feature.kmodel"
+FEATURE_CACHE = "/sd/features.bin"
+THRESHOLDS_FILE = "/sd/thresholds.bin"
 MAX_CLASS = 10
+ENROLL_RESERVE = 8  # rows preallocated for images enrolled while recognizing
 SIMILARITY_THRESHOLD = 0.3
+ADAPTIVE_THRESHOLDS = True  # lower the threshold of classes that are close to another class, see README
+MIN_CLASS_THRESHOLD = 0.1  # adaptive thresholds never go below this
+CLASS_THRESHOLDS = {}  # {class: threshold} overriding the adaptive ones, e.g. from python -m sim.similarity
+THRESHOLDS_STEP_MS = 10  # ms per frame spent measuring the adaptive thresholds until they are done
+SMOOTHING_WINDOW = 5  # frames; a class is reported once it wins SMOOTHING_VOTES of them (1: no smoothing)
+SMOOTHING_VOTES = 3
+SMOOTHING_ALPHA = 0.5  # weight of the newest frame in the averaged distance
+ENTER_THRESHOLD = None  # None: SIMILARITY_THRESHOLD
+EXIT_THRESHOLD = None  # None: ENTER_THRESHOLD + 0.05; the class is left when the averaged distance exceeds it
+QUANTIZATION = "int8"  # "int8", "int4" (half the memory) or "binary" (1/8), see README
+RERANK = 0  # > 0: score this many nearest candidates of an int4/binary scan again with int8 vectors
+SEARCH_THRESHOLD = 0.5  # classes farther than this are neither matched nor reported as runner-up
+RECOGNITION_WINDOWS = None  # None: the centered 224x224 window; or (x, y, w, h) windows of the 320x240 frame
+RECOGNITION_GRID = None  # (columns, rows, size): size x size windows on a grid instead, e.g. (3, 2, 160)
+RECOGNITION_FPS = 0  # > 0: evaluate only as many of the windows per frame as keep this frame rate
+FAST_BOOT = True  # no fixed waits; connect to the hub while the camera, the model and the features load
+PIPELINE = True  # overlap capture/display with the forward pass when the KPU can run asynchronously
+LPF2_LOW_LATENCY = False  # True: send a new result to the hub immediately instead of on the next timer tick
+LPF2_KEEPALIVE_PERIOD = 200  # ms
+LPF2_TIMEOUT = 1000  # ms without a message from the hub before the link is considered lost
+LPF2_RETRY_MAX = 5000  # ms; a handshake without ACK is retried after 100 ms, 200 ms, ... up to this
+LPF2_DIAGNOSTICS = False  # True: add mode 9 (DIAG), which sends the link statistics to the hub
+LPF2_STATS_PERIOD = 0  # s; > 0: print the link statistics to the console this often
+PERFORMANCE_PROFILE = None  # None: use the values below, or one of PERFORMANCE_PROFILES
+DISPLAY_INTERVAL = 0  # ms between LCD refreshes; 0: every frame, -1: only when the class changes
+SCENE_CHANGE_THRESHOLD = 0.0  # > 0: skip the forward pass while the histogram moves less than this (L1)
+SCENE_MAX_SKIP = 30  # frames a static scene may skip in a row
+GC_BUDGET = 0.05  # fraction of the time that explicit garbage collections may take
+GC_RESERVE = 65536  # bytes; collect regardless of GC_BUDGET when less of the heap is free
+SESSION_LOG_DIR = None  # e.g. "/sd/logs": record every recognized frame to session_N.bin there, see README
+SESSION_LOG_FRAMES = 8  # records per write to the SD card
+BENCHMARK_FRAMES = 0  # > 0: measure per-stage timings of this many frames
+BENCHMARK_CSV = "/sd/benchmark.csv"
+
+# settings above can be overridden by /sd/config.py
+try:
+    from config import *
+except ImportError:
+    pass
+
+# (DISPLAY_INTERVAL, SCENE_CHANGE_THRESHOLD)
+PERFORMANCE_PROFILES = {
+    "default": (0, 0.0),
+    "throughput": (500, 0.05),
+    "headless": (-1, 0.05),
+}
+if PERFORMANCE_PROFILE is not None:
+    DISPLAY_INTERVAL, SCENE_CHANGE_THRESHOLD = PERFORMANCE_PROFILES[PERFORMANCE_PROFILE]
+if ENTER_THRESHOLD is None:
+    ENTER_THRESHOLD = SIMILARITY_THRESHOLD
+if EXIT_THRESHOLD is None:
+    EXIT_THRESHOLD = ENTER_THRESHOLD + 0.05
 
 
 lcd.init()
@@ -92,7 +159,7 @@ def play_sound(filename):
     except:
         pass
 
-def initialize_camera():
+def initialize_camera(windowing=True):
     err_counter = 0
     while True:
         try:
@@ -107,51 +174,79 @@ def initialize_camera():
 
     sensor.set_pixformat(sensor.RGB565)
     sensor.set_framesize(sensor.QVGA)  # QVGA=320x240
-    sensor.set_windowing((224, 224))
+    if windowing:
+        sensor.set_windowing((224, 224))
     sensor.run(1)
 
-def get_feature(task, img):
-    feature = kpu.forward(task, img)
-    return feature
-
-def quantize_vector(vec):
-    mx = max([abs(x) for x in vec])
-
-    l = 0.0
-    qvec = []
-    for x in vec:
-        qx = int(x / mx * 127 + 127)
-        px = qx - 127
-        l += px * px
-        qvec.append(qx)
-
-    l = math.sqrt(l)
-
-    return l, bytearray(qvec)
-
-def get_cos_distance(l1, qvec1, l2, qvec2):
-    prod = 0.0
-    for x1, x2 in zip(qvec1, qvec2):
-        prod += (x1 - 127) * (x2 - 127)
-    prod = prod / l1 / l2
-
-    return 1 - prod  # 計算誤差のため、時々0.0を下回ったり2.0を超えたりします。
-    #return min(1, max(0, 1 - prod))
-
-if "sd" not in os.listdir("/"):
+def boot_mark(stage):
+    # ms since boot.py started, printed with the first detection
+    boot_times.append((stage, time.ticks_diff(time.ticks_ms(), boot_ticks)))
+
+def hub_connected(link):
+    if link.connects == 1:
+        boot_mark("hub")
+
+def window_image(img, i):
+    # window i of the scheduler as a 224x224 input of the model
+    x, y, w, h = scheduler.windows[i]
+    window = img.copy(roi=(x, y, w, h))
+    if w != 224 or h != 224:
+        window = window.resize(224, 224)
+    return window
+
+def recognize_windows(img):
+    # matches the windows selected for this frame; returns the norm, the vector, the squared norm
+    # and the index of the window that matched best (for enrollment and the session log)
+    best = -1
+    for i in scheduler.select():
+        window = window_image(img, i)
+        window.pix_to_ai()
+        l, qvec = extractor.extract(window)
+        del window
+        profiler.mark(1)
+        nearest_class, nearest_dist, runner_up, runner_up_dist = index.nearest(l, qvec, SEARCH_THRESHOLD)
+        scheduler.update(i, nearest_class, nearest_dist, runner_up, runner_up_dist)
+        profiler.mark(3)
+        if best < 0 or nearest_dist < best_dist:
+            best = i
+            best_dist = nearest_dist
+            best_l, best_qvec, best_sq = l, bytearray(qvec), extractor.squared_norm
+    scheduler.done()
+    return best_l, best_qvec, best_sq, best
+
+def get_class_images(files, class_num):
+    # images/N.jpg and any images/N/*.jpg are prototypes of class N
+    paths = []
+    img_file = str(class_num) + ".jpg"
+    if img_file in files:
+        paths.append(IMAGES_DIR + "/" + img_file)
+    if str(class_num) in files:
+        class_dir = IMAGES_DIR + "/" + str(class_num)
+        try:
+            for name in sorted(uos.listdir(class_dir)):
+                if name.endswith(".jpg"):
+                    paths.append(class_dir + "/" + name)
+        except OSError:
+            pass
+    return paths
+
+if "sd" not in uos.listdir("/"):
     show_message("Error: Cannot read SD Card", x=96)
 
 try:
-    os.mkdir(IMAGES_DIR)
+    uos.mkdir(IMAGES_DIR)
 except Exception as e:
     pass
 
+boot_times = []
 show_image_file(STARTUP_IMAGE)
-time.sleep(2)
+if not FAST_BOOT:
+    time.sleep(2)
 
 if but_b.value() == 0:
     show_image_file(CAMERA_MODE_IMAGE)
-    time.sleep(2)
+    if not FAST_BOOT:
+        time.sleep(2)
 
     initialize_camera()
 
@@ -198,75 +293,309 @@ if but_b.value() == 0:
 else:
     should_connect_spike_prime = but_a.value() != 0
 
-    initialize_camera()
+    session_log = None
+
+    # set_data() and set_result() may be called while the hub is not connected; the values are
+    # sent once it is, and the link is re-established in the background when it is lost
+    sp_device = None
+    hub_link = None
+    if should_connect_spike_prime:
+        # the handshake drives the TX pin as a GPIO; GPIO1 and GPIO2 are the buttons, so that it
+        # must not take their default GPIO1
+        sp_device = MindstromsDevice(tx_pin=34, rx_pin=35, tx_gpio=GPIO.GPIO3, tx_fpioa_gpio=fm.fpioa.GPIO3,
+            keepalive_period=LPF2_KEEPALIVE_PERIOD, low_latency=LPF2_LOW_LATENCY, diagnostics=LPF2_DIAGNOSTICS)
+        hub_link = ConnectionManager(sp_device, LPF2_TIMEOUT, max_backoff=LPF2_RETRY_MAX,
+            on_connect=hub_connected)
+        if FAST_BOOT:
+            # the hub waits for the sensor from power-on; the handshake runs while the camera,
+            # the model and the features are loaded
+            hub_link.start()
+
+    windows = RECOGNITION_WINDOWS
+    if windows is None and RECOGNITION_GRID is not None:
+        windows = grid_windows(*RECOGNITION_GRID)
+    # the windows are cut from the whole QVGA frame
+    initialize_camera(windows is None)
+    boot_mark("camera")
 
     task = kpu.load(FEATURE_MODEL)
     info = kpu.netinfo(task)
+    boot_mark("model")
 
-    feature_list = []
+    heap = HeapMonitor(GC_BUDGET, GC_RESERVE)
+    extractor = FeatureExtractor(kpu, task, heap)
 
     try:
+        feature_cache = FeatureCache(FEATURE_CACHE, FEATURE_MODEL)
+        feature_cache.load()
+
         files = uos.listdir(IMAGES_DIR)
+        class_images = [get_class_images(files, class_num) for class_num in range(1, MAX_CLASS + 1)]
+        # the reference vectors go straight into the preallocated rows of the matcher
+        matcher = FeatureMatcher(capacity=sum([len(paths) for paths in class_images]) + ENROLL_RESERVE)
         for class_num in range(1, MAX_CLASS + 1):
-            img_file = str(class_num) + ".jpg"
-            if img_file in files:
-                img = image.Image(IMAGES_DIR + "/" + img_file, copy_to_fb=True)
+            for img_path in class_images[class_num - 1]:
+                cached = feature_cache.lookup(class_num, img_path)
+                if cached is not None:
+                    l, qvec = cached
+                    matcher.add(l, qvec, class_num)
+                    continue
+
+                img = image.Image(img_path, copy_to_fb=True)
                 img.draw_rectangle(0, 60, 320, 1, color=(0, 144, 255), thickness=10)
                 img.draw_string(50, 55, "Class:%d" % (class_num,), color=(255, 255, 255), scale=1)
                 lcd.display(img)
                 img.pix_to_ai()
                 #print(img)
-                feature = get_feature(task, img)
+                l, qvec = extractor.extract(img)
                 del img
-                l, qvec = quantize_vector(feature[:])
-                feature_list.append((l, qvec, class_num))
-                gc.collect()
-                kpu.fmap_free(feature)
-
-        lcd.clear()
+                matcher.add(l, qvec, class_num)
+                feature_cache.put(class_num, img_path, bytearray(qvec), extractor.squared_norm)
+        del class_images
 
-        for l1, qvec1, class_num in feature_list:
-            similarities = ""
-            for l2, qvec2, _ in feature_list:
-                dist = get_cos_distance(l1, qvec1, l2, qvec2)
-                similarities += "%0.2f  " % (dist,)
-            print(class_num, similarities)
+        features_changed = True
+        try:
+            features_changed = feature_cache.save()
+        except OSError:
+            show_message("Error: Cannot Write to SD Card", x=124)
+        del feature_cache
+        heap.collect(True)
 
-        sp_device = None
-        if should_connect_spike_prime:
+        lcd.clear()
+        boot_mark("features")
+        heap.report("heap after loading")
+
+        enroll_class = 1
+        while enroll_class < MAX_CLASS and enroll_class in matcher.class_nums[:matcher.count]:
+            enroll_class += 1
+
+        thresholds = ClassThresholds(MAX_CLASS, ENTER_THRESHOLD, MIN_CLASS_THRESHOLD,
+            EXIT_THRESHOLD - ENTER_THRESHOLD, CLASS_THRESHOLDS)
+        class_index = None
+        if QUANTIZATION == QUANT_INT8 or ADAPTIVE_THRESHOLDS:
+            class_index = ClassIndex(matcher)
+        # the statistics are kept next to the feature cache (python -m sim.enroll writes them on the
+        # host); when they are outdated the classes are measured again between frames, as this
+        # scans the prototypes about N x N times, and recognition starts with ENTER_THRESHOLD
+        thresholds_index = None
+        if ADAPTIVE_THRESHOLDS and matcher.count > 0:
+            if features_changed or not thresholds.load(THRESHOLDS_FILE, class_index):
+                thresholds.start(class_index)
+                thresholds_index = class_index
+
+        if QUANTIZATION == QUANT_INT8:
+            index = class_index
+        else:
+            # without re-ranking the int8 vectors are dropped and only the packed codes stay (once
+            # the thresholds are measured)
+            index = pack_matcher(matcher, QUANTIZATION, RERANK)
+            matcher = None
+            class_index = None
+            heap.collect(True)
+        use_class_thresholds = ADAPTIVE_THRESHOLDS or len(CLASS_THRESHOLDS) > 0
+        if use_class_thresholds:
+            index.class_thresholds = thresholds.limits
+
+        if hub_link is not None and not hub_link.running:
             show_message("Connecting to LPF2 Hub...", x=100, bg_color=lcd.BLACK)
-            sp_device = MindstromsDevice(tx_pin=34, rx_pin=35)
-            sp_device.initialize()
-
-            while True:
-                if sp_device.connected:
-                    break
-                sp_device.initialize()
-                time.sleep_ms(100)
-
+            while not hub_link.poll():
+                time.sleep_ms(ConnectionManager.POLL_PERIOD)
+            hub_link.start()
+
+        profiler = FrameProfiler(("snapshot", "forward", "quantize", "match", "decide", "io", "set_data", "draw",
+            "display", "thresholds", "gc"), BENCHMARK_FRAMES)
+
+        forward = ForwardPipeline(kpu, task, PIPELINE and windows is None)
+        if PIPELINE and windows is None and not forward.available:
+            # stock MaixPy builds have only the blocking forward()
+            print("pipeline: the KPU module has no run/poll, the forward pass is not pipelined")
+        print("pipeline:", forward.available)
+        scheduler = None
+        if windows is not None:
+            scheduler = WindowScheduler(windows, RECOGNITION_FPS, ENTER_THRESHOLD)
+
+        scene = SceneChangeDetector(SCENE_CHANGE_THRESHOLD, SCENE_MAX_SKIP)
+        decision = DecisionFilter(SMOOTHING_WINDOW, SMOOTHING_VOTES, SMOOTHING_ALPHA, ENTER_THRESHOLD,
+            EXIT_THRESHOLD)
+        if use_class_thresholds:
+            decision.class_thresholds = thresholds.values
+
+        if SESSION_LOG_DIR is not None:
+            try:
+                session_log = SessionLog(next_session_path(SESSION_LOG_DIR),
+                    dict([(name, globals()[name]) for name in SETTINGS]), SESSION_LOG_FRAMES)
+            except OSError:
+                show_message("Error: Cannot Write to SD Card", x=124)
+
+        # live enrollment: button B selects the class, button A adds the current frame to it
+        enroller = Enroller(IMAGES_DIR, FEATURE_CACHE, FEATURE_MODEL)
+        enroll_message = None
+        enroll_message_ticks = 0
+        stats_ticks = time.ticks_ms()
+        isButtonPressedA = 1
+        isButtonPressedB = 1
+
+        frame_count = 0
+        inference_count = 0
+        detected = False
+        skipped_frames = 0
+        display_count = 0
+        similar_class = 0
+        min_dist = 1.0
+        runner_up = 0
+        region = 0
+        current_window = -1
+        displayed_class = -1
+        last_display_ticks = time.ticks_ms()
         while True:
+            profiler.start()
             img = sensor.snapshot()
+            profiler.mark(0)
+
+            if scene.changed(img):
+                if scheduler is not None:
+                    # the windows are matched one after the other; each forward pass (quantized with it)
+                    # and each match is charged to its stage. The result aggregates the latest match of
+                    # every window
+                    current_l, current_qvec, current_sq, current_window = recognize_windows(img)
+                    nearest_class, nearest_dist, runner_up, runner_up_dist = scheduler.result()
+                    profiler.mark(3)
+                else:
+                    # pipelined: the result belongs to the previous frame, which is returned from its input
+                    # buffer and is what gets labeled and displayed (the display lags by one frame)
+                    img, current_feature = forward.push(img)
+                    if current_feature is None:
+                        # the first frame only fills the pipeline and is not profiled
+                        profiler.discard()
+                        continue
+                    profiler.mark(1)
+                    current_l, current_qvec = extractor.quantize(current_feature)
+                    current_sq = extractor.squared_norm
+                    del current_feature
+                    profiler.mark(2)
+                    nearest_class, nearest_dist, runner_up, runner_up_dist = index.nearest(current_l, current_qvec,
+                        SEARCH_THRESHOLD)
+                    profiler.mark(3)
+                similar_class, min_dist = decision.update(nearest_class, nearest_dist, runner_up, runner_up_dist)
+                if scheduler is not None:
+                    region = scheduler.region(similar_class)
+                profiler.mark(4)
+                if session_log is not None:
+                    session_log.record(frame_count, current_sq, current_qvec, nearest_class, nearest_dist,
+                        runner_up, runner_up_dist, similar_class, min_dist)
+                inference_count += 1
+                if inference_count == 1:
+                    boot_mark("first frame")
+                if similar_class > 0 and not detected:
+                    # time to first detection, with the stages of the start-up it waited for
+                    detected = True
+                    boot_mark("first detection")
+                    print("boot: " + ", ".join(["%s %d ms" % x for x in boot_times]))
+            else:
+                # static scene: the last result still holds
+                skipped_frames += 1
+                if scheduler is not None:
+                    scheduler.skip()
+                profiler.mark(4)
+            frame_count += 1
+
+            if but_a.value() == 0 and isButtonPressedA == 0 and inference_count > 0:
+                qvec = bytearray(current_qvec)
+                enroll_img = img.copy() if current_window < 0 else window_image(img, current_window)
+                if enroller.enroll(enroll_img, enroll_class, qvec, current_sq) is not None:
+                    index.add(current_l, qvec, enroll_class)
+                    if ADAPTIVE_THRESHOLDS and QUANTIZATION == QUANT_INT8:
+                        # the statistics file is not rewritten here; the next start finds it
+                        # outdated and measures the classes again in the background
+                        thresholds.add_prototype(index, enroll_class)
+                    enroll_message = "Enrolled:%d" % (enroll_class,)
+                else:
+                    enroll_message = "Busy"
+                enroll_message_ticks = time.ticks_ms()
+                isButtonPressedA = 1
+            if but_a.value() == 1:
+                isButtonPressedA = 0
 
-            current_feature = get_feature(task, img)
-            current_l, current_qvec = quantize_vector(current_feature[:])
-            similar_class = 0
-            min_dist = 10.0
-            kpu.fmap_free(current_feature)
-            for l, qvec, class_num in feature_list:
-                dist = get_cos_distance(l, qvec, current_l, current_qvec)
-                if dist <= SIMILARITY_THRESHOLD and dist < min_dist:
-                    similar_class = class_num
-                    min_dist = dist
+            if but_b.value() == 0 and isButtonPressedB == 0:
+                enroll_class = enroll_class % MAX_CLASS + 1
+                enroll_message = "Enroll:%d" % (enroll_class,)
+                enroll_message_ticks = time.ticks_ms()
+                isButtonPressedB = 1
+            if but_b.value() == 1:
+                isButtonPressedB = 0
+            profiler.mark(5)
 
             if sp_device is not None:
+                if not hub_link.threaded:
+                    hub_link.poll()
                 sp_device.set_data(similar_class * 10)
-
-            if similar_class > 0:
+                sp_device.set_result(similar_class, min_dist, runner_up, frame_count, region)
+            profiler.mark(6)
+
+            now = time.ticks_ms()
+            if sp_device is not None and LPF2_STATS_PERIOD > 0 and \
+                    time.ticks_diff(now, stats_ticks) >= LPF2_STATS_PERIOD * 1000:
+                stats_ticks = now
+                sp_device.stats.report("hub link")
+            if enroll_message is not None and time.ticks_diff(now, enroll_message_ticks) > 1000:
+                enroll_message = None
+            should_display = similar_class != displayed_class or enroll_message is not None or \
+                (DISPLAY_INTERVAL >= 0 and time.ticks_diff(now, last_display_ticks) >= DISPLAY_INTERVAL)
+            if should_display and similar_class > 0:
                 img.draw_rectangle(0, 60, 320, 1, color=(0, 144, 255), thickness=10)
                 img.draw_string(50, 55, "Class:%d" % (similar_class,), color=(255, 255, 255), scale=1)
-
-            lcd.display(img)
+            if should_display and region > 0:
+                x, y, w, h = scheduler.windows[region - 1]
+                img.draw_rectangle(x, y, w, h, color=(0, 144, 255), thickness=2)
+            if should_display and enroll_message is not None:
+                img.draw_string(50, 160, enroll_message, color=(255, 255, 255), scale=1)
+            profiler.mark(7)
+
+            if should_display:
+                lcd.display(img)
+                displayed_class = similar_class
+                last_display_ticks = now
+                display_count += 1
+            profiler.mark(8)
+
+            if thresholds_index is not None:
+                if thresholds.step(thresholds_index, THRESHOLDS_STEP_MS):
+                    try:
+                        thresholds.save(THRESHOLDS_FILE)
+                    except OSError:
+                        pass
+                    print("class thresholds measured after %d frames" % (frame_count,))
+                    thresholds_index = None
+            profiler.mark(9)
+
+            # garbage of this frame is collected here, within GC_BUDGET, rather than by an
+            # allocation at any point of a later frame
+            heap.collect()
+            profiler.mark(10)
+
+            if profiler.end():
+                profiler.report()
+                print("frames: %d, inferences: %d, skipped: %d, displayed: %d" % (frame_count,
+                    inference_count, skipped_frames, display_count))
+                heap.report()
+                if session_log is not None:
+                    print("session log: %d records, %d dropped, %d writes, %d errors" % (session_log.records,
+                        session_log.dropped, session_log.writes, session_log.errors))
+                if hub_link is not None:
+                    print("hub: connects %d, reconnects %d, lost %d, timeouts %d, dropped frames %d" % (
+                        hub_link.connects, hub_link.reconnects, hub_link.lost, hub_link.timeouts,
+                        sp_device.dropped_frames))
+                    sp_device.stats.report("hub link")
+                try:
+                    profiler.save_csv(BENCHMARK_CSV)
+                except OSError:
+                    print("Error: Cannot Write to SD Card")
 
     except KeyboardInterrupt:
+        if hub_link is not None:
+            hub_link.stop()
+            sp_device.stats.report("hub link")
+        if session_log is not None:
+            session_log.close()
         kpu.deinit(task)
         sys.exit()
@@ -0,0 +1,76 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+
+
+class ClassStore(object):
+    # Reference vectors packed for the small K210 heap: one contiguous int8 buffer of
+    # capacity x dim centered values (qx - 127), plus double norms (as computed, so that the
+    # distances are exact) and uint16 class numbers in parallel arrays. No object is allocated
+    # per vector. Rows are appended in O(1) while there is capacity; when it runs out, the
+    # buffers grow by half at once.
+    def __init__(self, capacity=0):
+        self.dim = 0
+        self.count = 0
+        self.capacity = 0
+        self.reserved = capacity
+        self.matrix = array("b")
+        self.norms = array("d")
+        self.class_nums = array("H")
+
+    def reserve(self, capacity):
+        if self.dim == 0:
+            # the buffers are allocated with the first vector, when the dimension is known
+            self.reserved = max(self.reserved, capacity)
+            return
+        if capacity <= self.capacity:
+            return
+        n = capacity - self.capacity
+        self.matrix.extend(bytes(n * self.dim))
+        self.norms.extend(array("d", [0.0 for _ in range(n)]))
+        self.class_nums.extend(array("H", [0 for _ in range(n)]))
+        self.capacity = capacity
+
+    def append(self, l, qvec, class_num):
+        if self.dim == 0:
+            self.dim = len(qvec)
+            self.reserve(max(self.reserved, 1))
+        if self.count == self.capacity:
+            self.reserve(self.capacity + self.capacity // 2 + 1)
+        row = self.count
+        self.count += 1
+        self.replace(row, l, qvec, class_num)
+        return row
+
+    def replace(self, row, l, qvec, class_num=None):
+        matrix = self.matrix
+        base = row * self.dim
+        for i in range(self.dim):
+            matrix[base + i] = qvec[i] - 127
+        self.norms[row] = l
+        if class_num is not None:
+            self.class_nums[row] = class_num
+
+    def get(self, row):
+        # (norm, qvec, class_num) of a row; the qvec is a new bytearray
+        base = row * self.dim
+        qvec = bytearray(self.dim)
+        matrix = self.matrix
+        for i in range(self.dim):
+            qvec[i] = matrix[base + i] + 127
+        return self.norms[row], qvec, self.class_nums[row]
+
+    def nbytes(self):
+        return self.capacity * (self.dim + 8 + 2)
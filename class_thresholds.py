@@ -0,0 +1,208 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+from array import array
+import math
+import time
+
+from matcher import BOUND_MARGIN
+
+
+THRESHOLDS_MAGIC = b"CHTH"
+THRESHOLDS_VERSION = 1
+# magic, version, number of classes, max_threshold the statistics were searched with
+HEADER_FORMAT = "<4sHHf"
+# class_num, number of prototypes, intra distance, inter distance
+ENTRY_FORMAT = "<HHff"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+
+NO_NEIGHBOR = 2.0
+
+
+def _bound(center_dist, radius):
+    # lower bound of the distance to any prototype within `radius` (an angle) of a center
+    angle = math.acos(max(-1.0, min(1.0, 1 - center_dist))) - radius
+    return 1 - math.cos(angle) if angle > 0 else 0.0
+
+
+class ClassThresholds(object):
+    # Per-class similarity thresholds derived from the prototypes.
+    # intra: mean distance from each prototype of a class to its nearest other prototype of the class
+    # (0 with a single prototype), inter: distance from the class to the nearest prototype of another
+    # class. A class accepts frames up to halfway between the two, clamped to
+    # [min_threshold, max_threshold]: isolated classes keep max_threshold, classes close to another
+    # one get a tighter threshold, so that frames lying between them are rejected.
+    # `limits` are the thresholds plus `margin` (the exit hysteresis of the decision filter); the
+    # matchers skip a class once it cannot come within its limit.
+    # Measuring a class scans the prototypes near each of its own, so all classes together cost
+    # about N x N distances. On the device they are measured a few at a time between frames (start(),
+    # then step() from the recognition loop); a class keeps max_threshold until it is measured.
+    # The measurement uses the query buffer of the matcher, so it must not run while a query does.
+    def __init__(self, max_class, max_threshold, min_threshold=0.0, margin=0.0, overrides=None):
+        n = max_class + 1
+        self.max_threshold = max_threshold
+        self.min_threshold = min(min_threshold, max_threshold)
+        self.margin = margin
+        self.overrides = overrides or {}
+        self.values = array("f", [max_threshold for _ in range(n)])
+        self.limits = array("f", [max_threshold + margin for _ in range(n)])
+        self.intra = array("f", [0.0 for _ in range(n)])
+        self.inter = array("f", [NO_NEIGHBOR for _ in range(n)])
+        self.prototypes = array("H", [0 for _ in range(n)])
+        self.pending = []  # positions in the ClassIndex of the classes still to measure
+        for class_num in range(n):
+            self._update(class_num)
+
+    def _update(self, class_num):
+        value = self.overrides.get(class_num)
+        if value is None:
+            value = (self.intra[class_num] + self.inter[class_num]) / 2
+            value = max(self.min_threshold, min(self.max_threshold, value))
+        self.values[class_num] = value
+        self.limits[class_num] = value + self.margin
+
+    def compute(self, index):
+        # statistics of all classes of a ClassIndex over the int8 prototypes, in one go
+        self.start(index)
+        while self.pending:
+            self._measure_next(index)
+
+    def start(self, index):
+        # all classes go back to max_threshold and are measured again by step()
+        for class_num in range(len(self.values)):
+            self.intra[class_num] = 0.0
+            self.inter[class_num] = NO_NEIGHBOR
+            self.prototypes[class_num] = 0
+            self._update(class_num)
+        self.pending = list(range(len(index.rows)))
+
+    def step(self, index, budget_ms=0):
+        # measures pending classes for about budget_ms, at least one; returns True when none is left
+        start = time.ticks_ms()
+        while self.pending:
+            self._measure_next(index)
+            if time.ticks_diff(time.ticks_ms(), start) >= budget_ms:
+                break
+        return not self.pending
+
+    def _measure_next(self, index):
+        j = self.pending.pop()
+        self._measure(index, j)
+        self._update(index.centers.class_nums[j])
+
+    def add_prototype(self, index, class_num):
+        # call after index.add(): the class is measured again, and the classes that the new
+        # prototype is nearer to than their nearest other class so far get a tighter threshold
+        matcher = index.matcher
+        j = index.positions[class_num]
+        self._measure(index, j)
+        self._update(class_num)
+
+        l, qvec, _ = matcher.get(matcher.count - 1)
+        center_dists = index.centers.distances(l, qvec)
+        for k in range(len(center_dists)):
+            other = index.centers.class_nums[k]
+            if k == j or _bound(center_dists[k], index.radii[k]) > self._search_limit(other):
+                continue
+            rows = index.rows[k]
+            prods = matcher.dot_products(qvec, rows)
+            for n in range(len(rows)):
+                dist = 1 - int(prods[n]) / matcher.norms[rows[n]] / l
+                if dist < self.inter[other]:
+                    self.inter[other] = max(0.0, dist)
+            self._update(other)
+
+    def _search_limit(self, class_num):
+        # other classes farther than this cannot lower the threshold: (intra + inter) / 2 is
+        # clamped to max_threshold beyond it
+        return 2 * self.max_threshold - self.intra[class_num] + BOUND_MARGIN
+
+    def _measure(self, index, j):
+        matcher = index.matcher
+        members = index.rows[j]
+        class_num = index.centers.class_nums[j]
+        vectors = [matcher.get(i) for i in members]
+
+        intra = 0.0
+        if len(members) > 1:
+            for n in range(len(members)):
+                l, qvec, _ = vectors[n]
+                prods = matcher.dot_products(qvec, members)
+                nearest = NO_NEIGHBOR
+                for m in range(len(members)):
+                    if m != n:
+                        nearest = min(nearest, 1 - int(prods[m]) / matcher.norms[members[m]] / l)
+                intra += nearest
+            intra /= len(members)
+        self.intra[class_num] = max(0.0, intra)
+
+        # the prototypes of another class k are scored only when the bound from the center of k
+        # (the angle to the center minus the radius of k) is within the search limit
+        limit = self._search_limit(class_num)
+        inter = NO_NEIGHBOR
+        for l, qvec, _ in vectors:
+            center_dists = index.centers.distances(l, qvec)
+            rows = []
+            for k in range(len(center_dists)):
+                if k != j and _bound(center_dists[k], index.radii[k]) <= min(limit, inter):
+                    rows.extend(index.rows[k])
+            prods = matcher.dot_products(qvec, rows)
+            for n in range(len(rows)):
+                inter = min(inter, 1 - int(prods[n]) / matcher.norms[rows[n]] / l)
+        self.inter[class_num] = max(0.0, inter)
+        self.prototypes[class_num] = len(members)
+
+    def load(self, path, index):
+        # restores the statistics saved for the same prototypes; False when they must be computed
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+        if len(data) < HEADER_SIZE:
+            return False
+        magic, version, count, max_threshold = struct.unpack_from(HEADER_FORMAT, data, 0)
+        # statistics searched with a smaller max_threshold may miss neighbors that matter now
+        if magic != THRESHOLDS_MAGIC or version != THRESHOLDS_VERSION or count != len(index.rows) or \
+                max_threshold < self.max_threshold - 1e-6 or len(data) < HEADER_SIZE + count * ENTRY_SIZE:
+            return False
+
+        entries = []
+        for n in range(count):
+            entry = struct.unpack_from(ENTRY_FORMAT, data, HEADER_SIZE + n * ENTRY_SIZE)
+            j = index.positions.get(entry[0])
+            if entry[0] >= len(self.values) or j is None or len(index.rows[j]) != entry[1]:
+                return False
+            entries.append(entry)
+
+        for class_num, prototypes, intra, inter in entries:
+            self.intra[class_num] = intra
+            self.inter[class_num] = inter
+            self.prototypes[class_num] = prototypes
+            self._update(class_num)
+        return True
+
+    def save(self, path):
+        class_nums = [c for c in range(len(self.values)) if self.prototypes[c] > 0]
+        with open(path, "wb") as f:
+            f.write(struct.pack(HEADER_FORMAT, THRESHOLDS_MAGIC, THRESHOLDS_VERSION, len(class_nums),
+                self.max_threshold))
+            for c in class_nums:
+                f.write(struct.pack(ENTRY_FORMAT, c, self.prototypes[c], self.intra[c], self.inter[c]))
@@ -0,0 +1,86 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+from feature_cache import FeatureCache
+
+
+def next_image_path(images_dir, class_num):
+    # images/N.jpg for the first image of a class, then images/N/1.jpg, images/N/2.jpg, ...
+    files = os.listdir(images_dir)
+    name = "%d.jpg" % (class_num,)
+    if name not in files:
+        return images_dir + "/" + name
+
+    class_dir = images_dir + "/%d" % (class_num,)
+    if str(class_num) in files:
+        existing = os.listdir(class_dir)
+    else:
+        os.mkdir(class_dir)
+        existing = []
+    n = len(existing) + 1
+    while ("%d.jpg" % (n,)) in existing:
+        n += 1
+    return class_dir + "/%d.jpg" % (n,)
+
+
+class Enroller(object):
+    # Stores a frame enrolled during recognition: the JPEG goes to the images directory and the
+    # feature is appended to the feature cache, in a background thread when _thread is available
+    # so that the recognition loop does not wait for the SD card.
+    def __init__(self, images_dir, cache_path, model_path, use_thread=True):
+        self.images_dir = images_dir
+        self.cache_path = cache_path
+        self.model_path = model_path
+        self.use_thread = use_thread and _thread is not None
+        self.busy = False
+        self.saved = 0
+        self.errors = 0
+
+    def enroll(self, img, class_num, qvec, sq):
+        # img must not be the frame buffer (pass a copy); returns the image path, or None while
+        # the previous image is still being written
+        if self.busy:
+            return None
+        try:
+            path = next_image_path(self.images_dir, class_num)
+        except OSError:
+            self.errors += 1
+            return None
+
+        self.busy = True
+        if self.use_thread:
+            _thread.start_new_thread(self._save, (img, path, class_num, qvec, sq))
+        else:
+            self._save(img, path, class_num, qvec, sq)
+        return path
+
+    def _save(self, img, path, class_num, qvec, sq):
+        try:
+            img.save(path, quality=95)
+            # the cache entry records the size and time of the written image
+            FeatureCache(self.cache_path, self.model_path).append(class_num, path, qvec, sq)
+            self.saved += 1
+        except Exception:
+            self.errors += 1
+        self.busy = False
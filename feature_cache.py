@@ -0,0 +1,270 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+import math
+
+
+# File layout (little endian):
+#   header: magic(4s), version(H), dim(H), count(H), model_size(I), model_mtime(I)
+#   entry:  class_num(H), image_size(I), image_mtime(I), squared_norm(I), path_length(B),
+#           image_path(path_length bytes), qvec(dim bytes)
+# A model_mtime or image_mtime of 0 matches any modification time: packs built on the host
+# (python -m sim.enroll) only record the sizes, since copying to the SD card changes the times.
+CACHE_MAGIC = b"CHSF"
+CACHE_VERSION = 2
+HEADER_FORMAT = "<4sHHHII"
+ENTRY_FORMAT = "<HIIIB"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+ENTRY_SIZE = struct.calcsize(ENTRY_FORMAT)
+
+
+def file_identity(path):
+    try:
+        st = os.stat(path)
+        return st[6] & 0xFFFFFFFF, int(st[8]) & 0xFFFFFFFF
+    except OSError:
+        return 0, 0
+
+
+def squared_norm(qvec):
+    sq = 0
+    for x in qvec:
+        px = x - 127
+        sq += px * px
+    return sq
+
+
+def read_entries(path):
+    # all entries of a cache file regardless of the model: (dim, [(image_path, class_num, squared_norm, qvec)])
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER_SIZE:
+        raise ValueError("not a feature cache: %s" % (path,))
+    magic, version, dim, count, _, _ = struct.unpack_from(HEADER_FORMAT, data, 0)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        raise ValueError("not a feature cache (version %d): %s" % (CACHE_VERSION, path))
+
+    entries = []
+    offset = HEADER_SIZE
+    for _ in range(count):
+        class_num, _, _, sq, path_length = struct.unpack_from(ENTRY_FORMAT, data, offset)
+        offset += ENTRY_SIZE
+        image_path = bytes(data[offset:offset + path_length]).decode()
+        offset += path_length
+        entries.append((image_path, class_num, sq, bytearray(data[offset:offset + dim])))
+        offset += dim
+    return dim, entries
+
+
+def write_entries(path, dim, entries, model_size):
+    # a cache file of [(image_path, class_num, image_size, squared_norm, qvec)] matching any time
+    with open(path, "wb") as f:
+        f.write(struct.pack(HEADER_FORMAT, CACHE_MAGIC, CACHE_VERSION, dim, len(entries), model_size, 0))
+        for image_path, class_num, size, sq, qvec in sorted(entries):
+            name = image_path.encode()
+            f.write(struct.pack(ENTRY_FORMAT, class_num, size, 0, sq, len(name)))
+            f.write(name)
+            f.write(qvec)
+
+
+class FeatureCache(object):
+    # The file is not read into memory: load() only indexes the entries, and lookup() reads the
+    # qvec of an entry into one reusable buffer, so the caller has to copy it before the next lookup.
+    # The file stays open from load() until save() or close().
+    def __init__(self, path, model_path):
+        self.path = path
+        self.model_size, self.model_mtime = file_identity(model_path)
+        self.dim = 0
+        self.entries = {}
+        self.fresh = {}
+        self.dirty = False
+        self.file = None
+        self.buffer = None
+
+    def _same_model(self, model_size, model_mtime):
+        return model_size == self.model_size and model_mtime in (0, self.model_mtime)
+
+    def load(self):
+        self.close()
+        self.entries = {}
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return 0
+
+        entries = self._index(f)
+        if entries is None:
+            f.close()
+            return 0
+
+        self.file = f
+        self.entries = entries
+        self.buffer = bytearray(self.dim)
+        return len(entries)
+
+    def _index(self, f):
+        # {image_path: (class_num, size, mtime, squared_norm, offset of the qvec)}, or None
+        header = f.read(HEADER_SIZE)
+        if len(header) < HEADER_SIZE:
+            return None
+
+        magic, version, dim, count, model_size, model_mtime = struct.unpack(HEADER_FORMAT, header)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            return None
+        if not self._same_model(model_size, model_mtime):
+            return None
+
+        entries = {}
+        offset = HEADER_SIZE
+        for _ in range(count):
+            entry = f.read(ENTRY_SIZE)
+            if len(entry) < ENTRY_SIZE:
+                return None
+            class_num, size, mtime, sq, path_length = struct.unpack(ENTRY_FORMAT, entry)
+            name = f.read(path_length)
+            if len(name) < path_length:
+                return None
+            offset += ENTRY_SIZE + path_length
+            entries[name.decode()] = (class_num, size, mtime, sq, offset)
+            offset += dim
+            f.seek(offset)
+
+        if f.seek(0, 2) < offset:
+            return None
+        self.dim = dim
+        return entries
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _read_qvec(self, offset):
+        self.file.seek(offset)
+        self.file.readinto(self.buffer)
+        return self.buffer
+
+    def lookup(self, class_num, image_path):
+        size, mtime = file_identity(image_path)
+        entry = self.entries.get(image_path)
+        if entry is None or entry[0] != class_num or entry[1] != size or entry[2] not in (0, mtime):
+            return None
+
+        self.fresh[image_path] = entry
+        return math.sqrt(entry[3]), self._read_qvec(entry[4])
+
+    def put(self, class_num, image_path, qvec, sq=None):
+        # qvec is kept until save()
+        size, mtime = file_identity(image_path)
+        if self.dim == 0:
+            self.dim = len(qvec)
+        if sq is None:
+            sq = squared_norm(qvec)
+        self.fresh[image_path] = (class_num, size, mtime, sq, qvec)
+        self.dirty = True
+
+    def save(self):
+        # entries that were not looked up in this session belong to removed images
+        for image_path in self.entries:
+            if image_path not in self.fresh:
+                self.dirty = True
+                break
+
+        if not self.dirty:
+            self.close()
+            return False
+
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(struct.pack(HEADER_FORMAT, CACHE_MAGIC, CACHE_VERSION, self.dim, len(self.fresh),
+                    self.model_size, self.model_mtime))
+                for image_path in sorted(self.fresh):
+                    class_num, size, mtime, sq, qvec = self.fresh[image_path]
+                    name = image_path.encode()
+                    f.write(struct.pack(ENTRY_FORMAT, class_num, size, mtime, sq, len(name)))
+                    f.write(name)
+                    # unchanged entries are copied from the old file
+                    f.write(self._read_qvec(qvec) if isinstance(qvec, int) else qvec)
+        finally:
+            self.close()
+
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+        os.rename(tmp_path, self.path)
+
+        self.entries = {}
+        self.fresh = {}
+        self.dirty = False
+        return True
+
+    def append(self, class_num, image_path, qvec, sq=None):
+        # adds one entry after the last one without rewriting the file; the count in the header is
+        # only updated after the entry is written. Falls back to a full save() when the file is
+        # missing, truncated or was written for another model.
+        size, mtime = file_identity(image_path)
+        if sq is None:
+            sq = squared_norm(qvec)
+        name = image_path.encode()
+        try:
+            with open(self.path, "r+b") as f:
+                header = f.read(HEADER_SIZE)
+                if len(header) == HEADER_SIZE:
+                    magic, version, dim, count, model_size, model_mtime = struct.unpack(HEADER_FORMAT, header)
+                    if magic == CACHE_MAGIC and version == CACHE_VERSION and dim == len(qvec) and \
+                            self._same_model(model_size, model_mtime):
+                        # walk the entries instead of seeking to the end, so that an entry left
+                        # uncounted by an interrupted append gets overwritten
+                        offset = self._end_of_entries(f, count, dim)
+                        if offset is not None:
+                            f.seek(offset)
+                            f.write(struct.pack(ENTRY_FORMAT, class_num, size, mtime, sq, len(name)))
+                            f.write(name)
+                            f.write(qvec)
+                            f.seek(0)
+                            f.write(struct.pack(HEADER_FORMAT, magic, version, dim, count + 1, model_size,
+                                model_mtime))
+                            return True
+        except OSError:
+            pass
+
+        self.load()
+        self.fresh = dict(self.entries)
+        self.put(class_num, image_path, qvec, sq)
+        return self.save()
+
+    def _end_of_entries(self, f, count, dim):
+        # offset after the last of count entries, or None when the file ends before it
+        offset = HEADER_SIZE
+        for _ in range(count):
+            f.seek(offset)
+            entry = f.read(ENTRY_SIZE)
+            if len(entry) < ENTRY_SIZE:
+                return None
+            offset += ENTRY_SIZE + struct.unpack(ENTRY_FORMAT, entry)[-1] + dim
+        if f.seek(0, 2) < offset:
+            return None
+        return offset
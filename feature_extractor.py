@@ -0,0 +1,45 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from quantizer import Quantizer
+
+
+class FeatureExtractor(object):
+    # Runs the feature model and quantizes its output straight from the KPU feature map into the
+    # scratch buffer of one Quantizer, then frees the feature map. No list of the output is built,
+    # so the only allocation per image is the returned buffer, which is reused: copy qvec with
+    # bytearray() to keep it. squared_norm is the one of the last vector.
+    # With a HeapMonitor, extract() lets it collect within its time budget after each image.
+    def __init__(self, kpu, task, heap=None):
+        self.kpu = kpu
+        self.task = task
+        self.heap = heap
+        self.quantizer = Quantizer()
+        self.squared_norm = 0
+
+    def extract(self, img):
+        # blocking forward pass of img (pix_to_ai() done), for the reference images
+        l, qvec = self.quantize(self.kpu.forward(self.task, img))
+        if self.heap is not None:
+            self.heap.collect()
+        return l, qvec
+
+    def quantize(self, fmap):
+        # for a feature map returned by the caller's forward pass (see ForwardPipeline)
+        try:
+            l, qvec = self.quantizer.quantize_fmap(fmap)
+        finally:
+            self.kpu.fmap_free(fmap)
+        self.squared_norm = self.quantizer.squared_norm
+        return l, qvec
@@ -0,0 +1,97 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+import time
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    return sorted_values[int(p * (len(sorted_values) - 1) + 0.5)]
+
+
+class FrameProfiler(object):
+    # Records the time spent in each stage of a frame with time.ticks_us().
+    # mark(stage) charges the time since the previous mark (or start()) to stage.
+    # Recording stops by itself after `frames` frames; with frames=0 it never starts.
+    def __init__(self, stages, frames):
+        self.stages = stages
+        self.frames = frames
+        self.samples = [array("L", [0 for _ in range(frames)]) for _ in stages]
+        self.totals = array("L", [0 for _ in range(frames)])
+        self.count = 0
+        self.active = frames > 0
+        self._frame_start = 0
+        self._last = 0
+
+    def start(self):
+        if not self.active:
+            return
+        self._frame_start = self._last = time.ticks_us()
+
+    def mark(self, stage):
+        if not self.active:
+            return
+        t = time.ticks_us()
+        self.samples[stage][self.count] += time.ticks_diff(t, self._last)
+        self._last = t
+
+    def discard(self):
+        # drops the samples of the current frame, for a frame that ends without a result
+        if not self.active:
+            return
+        for values in self.samples:
+            values[self.count] = 0
+
+    def end(self):
+        # returns True when the last frame to record has just ended
+        if not self.active:
+            return False
+        self.totals[self.count] = time.ticks_diff(time.ticks_us(), self._frame_start)
+        self.count += 1
+        if self.count >= self.frames:
+            self.active = False
+            return True
+        return False
+
+    def summary(self):
+        rows = []
+        for name, values in zip(self.stages + ("total",), self.samples + [self.totals]):
+            values = sorted(values[:self.count])
+            mean = sum(values) / len(values) if values else 0
+            rows.append((name, percentile(values, 0.5), percentile(values, 0.95),
+                values[-1] if values else 0, mean))
+        return rows
+
+    def fps(self):
+        if self.count == 0:
+            return 0.0
+        total = sum(self.totals[:self.count])
+        return self.count * 1000000.0 / total if total > 0 else 0.0
+
+    def report(self):
+        print("frames: %d, fps: %0.2f" % (self.count, self.fps()))
+        print("%-10s %9s %9s %9s %9s" % ("stage[us]", "p50", "p95", "max", "mean"))
+        for name, p50, p95, mx, mean in self.summary():
+            print("%-10s %9d %9d %9d %9d" % (name, p50, p95, mx, mean))
+
+    def save_csv(self, path):
+        with open(path, "w") as f:
+            f.write("frame," + ",".join(self.stages) + ",total\n")
+            for i in range(self.count):
+                f.write("%d," % (i,))
+                for values in self.samples:
+                    f.write("%d," % (values[i],))
+                f.write("%d\n" % (self.totals[i],))
@@ -0,0 +1,84 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gc
+import time
+
+
+class HeapMonitor(object):
+    # Garbage collection within a time budget, and the high-water marks of the heap.
+    # gc.collect() scans the whole heap, so it takes about as long after one image as after ten.
+    # collect() is called once per image or frame but only collects when the time spent collecting
+    # stays within `budget` (a fraction of the elapsed time), or when less than `reserve` bytes of
+    # the heap are free, before the next large allocation could fail. With a budget of 0 only the
+    # reserve (and force) makes it collect.
+    # The marks are sampled at each collect(): peak_alloc is the most heap in use before a
+    # collection (live data and garbage), peak_live the most still in use after one, min_free the
+    # least free heap. They need gc.mem_alloc() / gc.mem_free() (MicroPython); `available` is
+    # False without them and only the budget applies.
+    def __init__(self, budget=0.05, reserve=65536):
+        self.budget = budget
+        self.reserve = reserve
+        self.available = hasattr(gc, "mem_alloc") and hasattr(gc, "mem_free")
+        self.next_ticks = time.ticks_ms()
+        self.collections = 0
+        self.collect_ms = 0
+        self.max_collect_ms = 0
+        self.peak_alloc = 0
+        self.peak_live = 0
+        self.min_free = -1
+
+    def sample(self):
+        # returns the free heap in bytes, or -1 when it cannot be measured
+        if not self.available:
+            return -1
+        alloc = gc.mem_alloc()
+        free = gc.mem_free()
+        if alloc > self.peak_alloc:
+            self.peak_alloc = alloc
+        if self.min_free < 0 or free < self.min_free:
+            self.min_free = free
+        return free
+
+    def collect(self, force=False):
+        # returns True if a collection ran
+        free = self.sample()
+        start = time.ticks_ms()
+        in_budget = self.budget > 0 and time.ticks_diff(start, self.next_ticks) >= 0
+        if not force and not in_budget and (free < 0 or free >= self.reserve):
+            return False
+
+        gc.collect()
+        end = time.ticks_ms()
+        elapsed = time.ticks_diff(end, start)
+        self.collections += 1
+        self.collect_ms += elapsed
+        if elapsed > self.max_collect_ms:
+            self.max_collect_ms = elapsed
+        # the next collection waits until this one is `budget` of the time in between
+        self.next_ticks = time.ticks_add(end, int(elapsed / self.budget) if self.budget > 0 else 0)
+        if self.available:
+            live = gc.mem_alloc()
+            if live > self.peak_live:
+                self.peak_live = live
+        return True
+
+    def report(self, label="heap"):
+        if self.available:
+            print("%s: peak allocated %d, peak live %d, min free %d bytes, %d collections, %d ms (max %d ms)" % (
+                label, self.peak_alloc, self.peak_live, self.min_free, self.collections, self.collect_ms,
+                self.max_collect_ms))
+        else:
+            print("%s: %d collections, %d ms (max %d ms)" % (label, self.collections, self.collect_ms,
+                self.max_collect_ms))
@@ -0,0 +1,147 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from array import array
+import time
+
+
+class Histogram(object):
+    # Counts of values in power-of-two buckets: bucket 0 holds 0, bucket i the values from 2**(i-1)
+    # to 2**i - 1, the last one everything above. add() does not allocate, so it can be called
+    # from the timer callback.
+    def __init__(self, buckets=20):
+        self.counts = array("L", [0 for _ in range(buckets)])
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        if value < 0:
+            value = 0
+        i = 0
+        v = value
+        last = len(self.counts) - 1
+        while v > 0 and i < last:
+            v >>= 1
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        # the upper bound of the bucket holding the p-th value (at most the largest value seen)
+        if self.count == 0:
+            return 0
+        rank = int(p * (self.count - 1) + 0.5)
+        seen = 0
+        for i in range(len(self.counts)):
+            seen += self.counts[i]
+            if seen > rank:
+                return min((1 << i) - 1, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total // self.count if self.count > 0 else 0
+
+    def line(self):
+        return "n %d, p50 %d, p95 %d, max %d, mean %d" % (self.count, self.percentile(0.5),
+            self.percentile(0.95), self.max, self.mean())
+
+
+class LinkStats(object):
+    # Counters and histograms of an LPF2 link (SpikePrimeDevice, MindstromsDevice), updated by the
+    # device as it sends and receives: DATA messages and bytes sent, writes that failed or were
+    # short, the interval between the hub's NACKs, messages rejected by the parser, mode switches,
+    # the time from a new value (set_data/set_result) to its transmission and the time spent in
+    # the keep-alive timer callback. report() prints them; values() is what the diagnostic mode
+    # sends to the hub.
+    def __init__(self, parser):
+        self.parser = parser
+        self.reset()
+
+    def reset(self):
+        self.start_ticks = time.ticks_ms()
+        self.frames = 0  # DATA messages written
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.short_writes = 0  # fewer bytes written than the message has
+        self.failed_writes = 0
+        self.nacks = 0
+        self.last_nack_ticks = None
+        self.mode_switches = 0
+        self.unexpected = 0  # messages of the hub the device does not handle
+        self.last_unexpected = 0
+        self.parser_errors = self.parser.checksum_errors + self.parser.overflows
+        self.nack_interval_ms = Histogram()
+        self.latency_us = Histogram()
+        self.callback_us = Histogram()
+
+    def connected(self):
+        # the interval to the first NACK of a new link is not a NACK interval
+        self.last_nack_ticks = None
+
+    def sent(self, length, size):
+        self.frames += 1
+        if not size:
+            self.failed_writes += 1
+            return
+        self.bytes_sent += size
+        if size < length:
+            self.short_writes += 1
+
+    def nacked(self):
+        # called by a timer callback that read NACKs, so the intervals are multiples of the timer
+        # period when it is longer than the hub's (about 100 ms)
+        now = time.ticks_ms()
+        if self.last_nack_ticks is not None:
+            self.nack_interval_ms.add(time.ticks_diff(now, self.last_nack_ticks))
+        self.last_nack_ticks = now
+
+    def checksum_errors(self):
+        # bytes the parser dropped (bad checksums, garbage, ring buffer overflows) since reset()
+        return self.parser.checksum_errors + self.parser.overflows - self.parser_errors
+
+    def elapsed_ms(self):
+        return time.ticks_diff(time.ticks_ms(), self.start_ticks)
+
+    def bytes_per_second(self):
+        elapsed = self.elapsed_ms()
+        return self.bytes_sent * 1000 // elapsed if elapsed > 0 else 0
+
+    def values(self):
+        # the 8 values of the diagnostic mode
+        return (self.frames, self.bytes_per_second(), self.nacks, self.nack_interval_ms.percentile(0.95),
+            self.checksum_errors(), self.mode_switches, self.latency_us.percentile(0.5),
+            self.latency_us.percentile(0.95))
+
+    def report(self, label="link"):
+        print("%s: %d s, %d frames, %d bytes/s, %d bytes received, %d short writes, %d failed writes" % (
+            label, self.elapsed_ms() // 1000, self.frames, self.bytes_per_second(), self.bytes_received,
+            self.short_writes, self.failed_writes))
+        print("%s: %d NACKs, %d checksum errors, %d mode switches, %d unexpected messages (last 0x%02x)" % (
+            label, self.nacks, self.checksum_errors(), self.mode_switches, self.unexpected,
+            self.last_unexpected))
+        print("%s: NACK interval [ms] %s" % (label, self.nack_interval_ms.line()))
+        print("%s: latency [us] %s" % (label, self.latency_us.line()))
+        print("%s: timer callback [us] %s" % (label, self.callback_us.line()))
@@ -0,0 +1,503 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+import math
+
+from class_store import ClassStore
+
+try:
+    from ulab import numpy as np
+except ImportError:
+    try:
+        import ulab as np
+    except ImportError:
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+
+
+BOUND_MARGIN = 1e-6
+BLOCK_ROWS = 16  # rows widened at a time for the numpy/ulab dot products
+
+
+def get_cos_distance(l1, qvec1, l2, qvec2):
+    prod = 0.0
+    for x1, x2 in zip(qvec1, qvec2):
+        prod += (x1 - 127) * (x2 - 127)
+    prod = prod / l1 / l2
+
+    return 1 - prod  # 計算誤差のため、時々0.0を下回ったり2.0を超えたりします。
+    #return min(1, max(0, 1 - prod))
+
+
+class FeatureMatcher(ClassStore):
+    # All reference vectors are kept pre-centered (qx - 127) in one contiguous int8 matrix
+    # (see ClassStore), so that a frame is scored against every class in a single pass.
+    # The dot products are exact integers and the norms are kept as computed, hence the distances
+    # equal get_cos_distance().
+    # class_thresholds (an array indexed by class number, see ClassThresholds.limits) optionally
+    # limits the distance at which each class is accepted by top_k() and nearest().
+    # With numpy/ulab the int8 matrix is used in place; an int8 dot product would overflow, so
+    # BLOCK_ROWS rows at a time are widened for the product instead of keeping a wide copy of the
+    # whole matrix (4 times the int8 one).
+    def __init__(self, use_numpy=True, capacity=0):
+        ClassStore.__init__(self, capacity)
+        self.use_numpy = use_numpy and np is not None
+        self.class_thresholds = None
+        self._live = array("b")
+
+    def add(self, l, qvec, class_num):
+        if self.count == 0:
+            self._live = array("b", bytes(len(qvec)))
+        self.append(l, qvec, class_num)
+
+    def _np_rows(self, start, end):
+        # rows start..end-1 of the int8 matrix as a numpy/ulab view, without a copy
+        dim = self.dim
+        return np.frombuffer(self.matrix, dtype=np.int8, count=(end - start) * dim,
+            offset=start * dim).reshape((end - start, dim))
+
+    def dot_products(self, qvec, rows=None):
+        # dot products of the centered qvec with all rows, or with the given row indices
+        self.set_query(qvec)
+        return self.query_products(rows)
+
+    def set_query(self, qvec):
+        live = self._live
+        for i in range(self.dim):
+            live[i] = qvec[i] - 127
+
+    def query_products(self, rows=None):
+        # dot products with the qvec given to the last set_query()
+        live = self._live
+        if self.use_numpy:
+            wide = np.int32 if hasattr(np, "int32") else np.float
+            v = np.array(live, dtype=wide)
+            if rows is None:
+                prods = np.zeros(self.count, dtype=wide)
+                for start in range(0, self.count, BLOCK_ROWS):
+                    end = min(start + BLOCK_ROWS, self.count)
+                    prods[start:end] = np.dot(np.array(self._np_rows(start, end), dtype=wide), v)
+                return prods
+            return [np.dot(np.array(self._np_rows(i, i + 1)[0], dtype=wide), v) for i in rows]
+
+        dim = self.dim
+        matrix = memoryview(self.matrix)
+        prods = []
+        for i in (range(self.count) if rows is None else rows):
+            prod = 0
+            for x1, x2 in zip(matrix[i * dim:(i + 1) * dim], live):
+                prod += x1 * x2
+            prods.append(prod)
+        return prods
+
+    def distances(self, l, qvec):
+        if self.count == 0:
+            return []
+        prods = self.dot_products(qvec)
+        norms = self.norms
+        return [1 - int(prods[i]) / norms[i] / l for i in range(self.count)]
+
+    def match(self, l, qvec, threshold):
+        similar_class = 0
+        min_dist = 10.0
+        if self.count == 0:
+            return similar_class, min_dist
+
+        prods = self.dot_products(qvec)
+        norms = self.norms
+        class_nums = self.class_nums
+        for i in range(self.count):
+            prod = int(prods[i])
+            # a non-positive product means dist >= 1, which can never pass a threshold below 1
+            if prod <= 0 and threshold < 1:
+                continue
+            dist = 1 - prod / norms[i] / l
+            if dist <= threshold and dist < min_dist:
+                similar_class = class_nums[i]
+                min_dist = dist
+
+        return similar_class, min_dist
+
+    def top_k(self, l, qvec, k, threshold=None):
+        # the k nearest classes as [(class_num, distance), ...], nearest first;
+        # a class with several rows (prototypes) scores with its nearest one
+        if self.count == 0:
+            return []
+        return _select_top_k(self.class_nums, self.distances(l, qvec), k, threshold, self.class_thresholds)
+
+    def nearest(self, l, qvec, threshold=None):
+        # nearest and runner-up classes within the threshold (if any)
+        return _nearest(self.top_k(l, qvec, 2, threshold))
+
+
+def _nearest(top):
+    # (best class, best distance, runner-up class, runner-up distance); 0 and 10.0 when missing
+    while len(top) < 2:
+        top.append((0, 10.0))
+    return top[0][0], top[0][1], top[1][0], top[1][1]
+
+
+def _insert_top_k(top, class_num, dist, k):
+    for i in range(len(top)):
+        if top[i][0] == class_num:
+            if dist >= top[i][1]:
+                return
+            del top[i]
+            break
+    i = len(top)
+    while i > 0 and dist < top[i - 1][1]:
+        i -= 1
+    if i < k:
+        top.insert(i, (class_num, dist))
+        if len(top) > k:
+            top.pop()
+
+
+def _class_limit(class_thresholds, class_num, threshold):
+    # the distance up to which a class is accepted, or None
+    if class_thresholds is None or class_num >= len(class_thresholds):
+        return threshold
+    if threshold is None:
+        return class_thresholds[class_num]
+    return min(threshold, class_thresholds[class_num])
+
+
+def _select_top_k(class_nums, dists, k, threshold=None, class_thresholds=None):
+    top = []
+    for i in range(len(dists)):
+        dist = dists[i]
+        limit = _class_limit(class_thresholds, class_nums[i], threshold)
+        if limit is not None and dist > limit:
+            continue
+        if len(top) == k and dist >= top[-1][1]:
+            continue
+        _insert_top_k(top, class_nums[i], dist, k)
+    return top
+
+
+class ClassIndex(object):
+    # Top-k search over classes that have several prototypes.
+    # Each class gets a center (the quantized mean direction of its prototypes) and an angular
+    # radius covering all of its prototypes. By the triangle inequality on the sphere, no prototype
+    # of a class can be closer to the query than the angle to its center minus its radius, so the
+    # classes are visited in order of that bound and the search stops as soon as the bound cannot
+    # beat the k-th best distance found so far. The result is the same as FeatureMatcher.top_k().
+    # With class_thresholds, a class is skipped when its bound exceeds its own limit, and the search
+    # stops early once the bound exceeds the largest limit of all classes.
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.class_thresholds = None
+        self.centers = FeatureMatcher(use_numpy=matcher.use_numpy)
+        self.radii = []
+        self.rows = []
+        self.positions = {}
+        self.visited = 0
+        self.rebuild()
+
+    def rebuild(self):
+        matcher = self.matcher
+        self.centers = FeatureMatcher(use_numpy=matcher.use_numpy)
+        self.radii = []
+        self.rows = []
+        self.positions = {}
+        for i in range(matcher.count):
+            class_num = matcher.class_nums[i]
+            j = self.positions.get(class_num)
+            if j is None:
+                j = len(self.rows)
+                self.positions[class_num] = j
+                self.rows.append([])
+            self.rows[j].append(i)
+
+        for j in range(len(self.rows)):
+            l, center, radius = self._center_of(self.rows[j])
+            self.centers.add(l, center, matcher.class_nums[self.rows[j][0]])
+            self.radii.append(radius)
+
+    def add(self, l, qvec, class_num):
+        # adds a prototype to the matcher and updates only the center of its class
+        matcher = self.matcher
+        matcher.add(l, qvec, class_num)
+        j = self.positions.get(class_num)
+        if j is None:
+            j = len(self.rows)
+            self.positions[class_num] = j
+            self.rows.append([matcher.count - 1])
+            l, center, radius = self._center_of(self.rows[j])
+            self.centers.add(l, center, class_num)
+            self.radii.append(radius)
+        else:
+            self.rows[j].append(matcher.count - 1)
+            l, center, radius = self._center_of(self.rows[j])
+            self.centers.replace(j, l, center)
+            self.radii[j] = radius
+
+    def _center_of(self, members):
+        matcher = self.matcher
+        dim = matcher.dim
+        rows = matcher.matrix
+        mean = [0.0] * dim
+        for i in members:
+            scale = 1.0 / matcher.norms[i]
+            base = i * dim
+            for j in range(dim):
+                mean[j] += rows[base + j] * scale
+        mx = max(max(mean), -min(mean))
+        center = bytearray(dim)
+        sq = 0
+        for j in range(dim):
+            c = int(round(mean[j] / mx * 127)) if mx > 0 else 0
+            center[j] = c + 127
+            sq += c * c
+        l = math.sqrt(sq)
+
+        radius = 0.0
+        for i in members:
+            prod = 0
+            base = i * dim
+            for j in range(dim):
+                prod += rows[base + j] * (center[j] - 127)
+            cos = prod / l / matcher.norms[i]
+            angle = math.acos(max(-1.0, min(1.0, cos)))
+            if angle > radius:
+                radius = angle
+        return l, center, radius
+
+    def top_k(self, l, qvec, k, threshold=None):
+        matcher = self.matcher
+        if matcher.count == 0:
+            return []
+        if self.centers.count == matcher.count:
+            # one prototype per class: the centers are the prototypes
+            self.visited = matcher.count
+            return _select_top_k(matcher.class_nums, matcher.distances(l, qvec), k, threshold,
+                self.class_thresholds)
+
+        center_dists = self.centers.distances(l, qvec)
+        bounds = []
+        for j in range(len(center_dists)):
+            angle = math.acos(max(-1.0, min(1.0, 1 - center_dists[j]))) - self.radii[j]
+            bounds.append(1 - math.cos(angle) if angle > 0 else 0.0)
+
+        class_thresholds = self.class_thresholds
+        ceiling = threshold
+        if class_thresholds is not None:
+            ceiling = max([class_thresholds[c] for c in self.centers.class_nums[:self.centers.count]])
+            if threshold is not None:
+                ceiling = min(threshold, ceiling)
+
+        top = []
+        visited = 0
+        matcher.set_query(qvec)
+        for j in sorted(range(len(bounds)), key=bounds.__getitem__):
+            limit = top[-1][1] if len(top) == k else ceiling
+            # the margin covers rounding errors of the bound
+            if limit is not None and bounds[j] > limit + BOUND_MARGIN:
+                break
+            class_num = self.centers.class_nums[j]
+            class_limit = _class_limit(class_thresholds, class_num, threshold)
+            if class_limit is not None and bounds[j] > class_limit + BOUND_MARGIN:
+                continue
+            members = self.rows[j]
+            prods = matcher.query_products(members)
+            visited += len(members)
+            for n in range(len(members)):
+                dist = 1 - int(prods[n]) / matcher.norms[members[n]] / l
+                if class_limit is not None and dist > class_limit:
+                    continue
+                _insert_top_k(top, class_num, dist, k)
+
+        self.visited = visited
+        # classes were visited out of order; restore the tie order of the exhaustive scan
+        return _stable_order(top, self.centers.class_nums, self.centers.count)
+
+    def nearest(self, l, qvec, threshold=None):
+        return _nearest(self.top_k(l, qvec, 2, threshold))
+
+
+def _stable_order(top, class_order, count):
+    rank = {}
+    for i in range(count):
+        rank[class_order[i]] = i
+    return sorted(top, key=lambda x: (x[1], rank[x[0]]))
+
+
+QUANT_INT8 = "int8"
+QUANT_INT4 = "int4"
+QUANT_BINARY = "binary"
+
+_popcounts = None
+_nibble_products = None
+
+
+def _popcount_table():
+    global _popcounts
+    if _popcounts is None:
+        _popcounts = bytes([bin(i).count("1") for i in range(256)])
+    return _popcounts
+
+
+def _nibble_product_table():
+    # table[(a << 8) | b]: dot product of the two signed nibbles of byte a with those of byte b
+    global _nibble_products
+    if _nibble_products is None:
+        nibbles = [((x & 0x0F) ^ 0x08) - 0x08 for x in range(16)]
+        nibbles[8] = 0  # -8 is never encoded; it would overflow the int8 table
+        table = array("b", bytes(65536))
+        for a in range(256):
+            lo = nibbles[a & 0x0F]
+            hi = nibbles[a >> 4]
+            base = a << 8
+            for b in range(256):
+                table[base | b] = lo * nibbles[b & 0x0F] + hi * nibbles[b >> 4]
+        _nibble_products = table
+    return _nibble_products
+
+
+def _to_int4(x):
+    c = x - 127
+    q = (abs(c) * 7 + 63) // 127
+    return q if c >= 0 else -q
+
+
+def encode(scheme, qvec, code):
+    # writes the int4 (two signed nibbles per byte) or binary (sign bits) code of qvec into code;
+    # returns the norm of the int4 code, or 0.0 for binary
+    dim = len(qvec)
+    if scheme == QUANT_BINARY:
+        for i in range(len(code)):
+            byte = 0
+            base = i * 8
+            for bit in range(min(8, dim - base)):
+                if qvec[base + bit] > 127:
+                    byte |= 1 << bit
+            code[i] = byte
+        return 0.0
+
+    sq = 0
+    for i in range(len(code)):
+        lo = _to_int4(qvec[2 * i])
+        hi = _to_int4(qvec[2 * i + 1]) if 2 * i + 1 < dim else 0
+        code[i] = (lo & 0x0F) | ((hi & 0x0F) << 4)
+        sq += lo * lo + hi * hi
+    return math.sqrt(sq)
+
+
+class PackedMatcher(object):
+    # Scans int4 or binary codes instead of the int8 vectors: half or an eighth of the memory,
+    # and one table lookup per byte instead of one multiplication per dimension.
+    # int4 estimates the cosine distance from the dot product of the codes; binary estimates it
+    # from the Hamming distance h of the sign bits as 1 - cos(pi * h / dim).
+    # With rerank > 0 the int8 vectors are kept too (in `fine`), and the `rerank` nearest rows
+    # of the scan are scored again at int8 precision.
+    def __init__(self, scheme, rerank=0, capacity=0):
+        if scheme not in (QUANT_INT4, QUANT_BINARY):
+            raise ValueError("unknown quantization: %s" % (scheme,))
+        self.scheme = scheme
+        self.rerank = rerank
+        self.fine = FeatureMatcher(capacity=capacity) if rerank > 0 else None
+        self.class_thresholds = None
+        self.dim = 0
+        self.code_size = 0
+        self.count = 0
+        self.capacity = 0
+        self.reserved = capacity
+        self.codes = bytearray()
+        self.norms = array("f")
+        self.class_nums = array("H")
+        self._query = bytearray()
+        self._table = _popcount_table() if scheme == QUANT_BINARY else _nibble_product_table()
+
+    def reserve(self, capacity):
+        if self.dim == 0:
+            self.reserved = max(self.reserved, capacity)
+            return
+        if capacity <= self.capacity:
+            return
+        n = capacity - self.capacity
+        self.codes.extend(bytes(n * self.code_size))
+        self.norms.extend(array("f", [0.0 for _ in range(n)]))
+        self.class_nums.extend(array("H", [0 for _ in range(n)]))
+        self.capacity = capacity
+
+    def add(self, l, qvec, class_num):
+        if self.dim == 0:
+            self.dim = len(qvec)
+            self.code_size = (self.dim + 7) // 8 if self.scheme == QUANT_BINARY else (self.dim + 1) // 2
+            self._query = bytearray(self.code_size)
+            self.reserve(max(self.reserved, 1))
+        if self.count == self.capacity:
+            self.reserve(self.capacity + self.capacity // 2 + 1)
+        row = self.count
+        base = row * self.code_size
+        self.norms[row] = encode(self.scheme, qvec, memoryview(self.codes)[base:base + self.code_size])
+        self.class_nums[row] = class_num
+        self.count += 1
+        if self.fine is not None:
+            self.fine.add(l, qvec, class_num)
+
+    def distances(self, l, qvec):
+        query = self._query
+        query_norm = encode(self.scheme, qvec, query)
+        table = self._table
+        size = self.code_size
+        codes = memoryview(self.codes)
+        dists = []
+        if self.scheme == QUANT_BINARY:
+            scale = math.pi / self.dim
+            for i in range(self.count):
+                h = 0
+                for a, b in zip(codes[i * size:(i + 1) * size], query):
+                    h += table[a ^ b]
+                dists.append(1 - math.cos(h * scale))
+        else:
+            norms = self.norms
+            for i in range(self.count):
+                prod = 0
+                for a, b in zip(codes[i * size:(i + 1) * size], query):
+                    prod += table[(a << 8) | b]
+                norm = norms[i] * query_norm
+                dists.append(1 - prod / norm if norm > 0 else 1.0)
+        return dists
+
+    def top_k(self, l, qvec, k, threshold=None):
+        if self.count == 0:
+            return []
+        coarse = self.distances(l, qvec)
+        if self.fine is None:
+            return _select_top_k(self.class_nums, coarse, k, threshold, self.class_thresholds)
+
+        rows = sorted(range(self.count), key=coarse.__getitem__)[:max(self.rerank, k)]
+        prods = self.fine.dot_products(qvec, rows)
+        norms = self.fine.norms
+        dists = [1 - int(prods[n]) / norms[rows[n]] / l for n in range(len(rows))]
+        return _select_top_k([self.class_nums[i] for i in rows], dists, k, threshold, self.class_thresholds)
+
+    def nearest(self, l, qvec, threshold=None):
+        return _nearest(self.top_k(l, qvec, 2, threshold))
+
+
+def pack_matcher(matcher, scheme, rerank=0):
+    # PackedMatcher with the rows of a FeatureMatcher, which is kept for re-ranking if rerank > 0
+    packed = PackedMatcher(scheme, capacity=matcher.capacity)
+    for i in range(matcher.count):
+        l, qvec, class_num = matcher.get(i)
+        packed.add(l, qvec, class_num)
+    if rerank > 0:
+        packed.rerank = rerank
+        packed.fine = matcher
+    return packed
@@ -0,0 +1,77 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+
+
+class ForwardPipeline(object):
+    # Runs the feature model one frame behind the camera.
+    # push(img) starts the forward pass of img and returns (previous image, its feature map),
+    # or (None, None) for the very first frame; while the KPU works on img, the caller matches
+    # and displays the previous frame and captures the next one.
+    # snapshot() writes every frame into the same buffer, which the KPU would still be reading,
+    # so each frame is first copied into one of two input buffers: the KPU reads one while the
+    # other holds the previous frame for matching, drawing and display.
+    # Needs the asynchronous run(task, img) / poll(task) of the KPU module; when the firmware
+    # does not have them, or the buffers do not fit in memory, `available` is False and push()
+    # runs the blocking forward() instead, returning img itself with its feature map.
+    def __init__(self, kpu, task, enabled=True):
+        self.kpu = kpu
+        self.task = task
+        self.available = enabled and hasattr(kpu, "run") and hasattr(kpu, "poll")
+        self.pending = None
+        self.buffers = []
+        self.frames = 0
+
+    def push(self, img):
+        if self.available:
+            try:
+                copied = self.copy(img)
+            except MemoryError:
+                print("pipeline: no memory for the input buffers, using forward()")
+                if self.pending is not None:
+                    self.kpu.fmap_free(self.wait())
+                self.available = False
+                self.pending = None
+                self.buffers = []
+        if not self.available:
+            return img, self.kpu.forward(self.task, img)
+
+        previous = self.pending
+        feature = None
+        if previous is not None:
+            feature = self.wait()
+        self.kpu.run(self.task, copied)
+        self.pending = copied
+        return previous, feature
+
+    def copy(self, img):
+        # the buffer not read by the KPU: it held the frame before the previous one
+        i = self.frames % 2
+        if i < len(self.buffers):
+            buf = self.buffers[i]
+            buf.draw_image(img, 0, 0)
+        else:
+            buf = img.copy()
+            self.buffers.append(buf)
+        buf.pix_to_ai()
+        self.frames += 1
+        return buf
+
+    def wait(self):
+        while True:
+            feature = self.kpu.poll(self.task)
+            if feature is not None:
+                return feature
+            time.sleep_ms(0)
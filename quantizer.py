@@ -0,0 +1,92 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+
+def quantize_vector(vec):
+    mx = max([abs(x) for x in vec])
+
+    l = 0.0
+    qvec = []
+    for x in vec:
+        qx = int(x / mx * 127 + 127)
+        px = qx - 127
+        l += px * px
+        qvec.append(qx)
+
+    l = math.sqrt(l)
+
+    return l, bytearray(qvec)
+
+
+class Quantizer(object):
+    # Same output as quantize_vector(), but writes into a reusable buffer and
+    # accumulates the squared norm as an integer (no temporary lists, no float accumulator).
+    # The returned qvec is overwritten by the next call; copy it with bytearray() to keep it.
+    def __init__(self, dim=0):
+        self.qvec = bytearray(dim)
+        self.squared_norm = 0
+        self.norm = 0.0
+
+    def quantize(self, vec):
+        n = len(vec)
+        if len(self.qvec) != n:
+            self.qvec = bytearray(n)
+
+        mx = max(vec)
+        mn = min(vec)
+        if -mn > mx:
+            mx = -mn
+
+        qvec = self.qvec
+        sq = 0
+        i = 0
+        for x in vec:
+            qx = int(x / mx * 127 + 127)
+            px = qx - 127
+            sq += px * px
+            qvec[i] = qx
+            i += 1
+
+        self.squared_norm = sq
+        self.norm = math.sqrt(sq)
+        return self.norm, qvec
+
+    def quantize_fmap(self, fmap):
+        # Same as quantize(), reading the values by index from a KPU feature map: no copy of the
+        # whole output (fmap[:]) is made, only the value being read is allocated at a time.
+        n = len(fmap)
+        if len(self.qvec) != n:
+            self.qvec = bytearray(n)
+
+        mx = 0.0
+        for i in range(n):
+            x = fmap[i]
+            if x > mx:
+                mx = x
+            elif -x > mx:
+                mx = -x
+
+        qvec = self.qvec
+        sq = 0
+        for i in range(n):
+            qx = int(fmap[i] / mx * 127 + 127)
+            px = qx - 127
+            sq += px * px
+            qvec[i] = qx
+
+        self.squared_norm = sq
+        self.norm = math.sqrt(sq)
+        return self.norm, qvec
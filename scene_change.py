@@ -0,0 +1,47 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+class SceneChangeDetector(object):
+    # Tells whether a frame differs enough from the last inferred frame to be worth a forward pass.
+    # Frames are compared by the L1 distance of their normalized lightness histograms, which the
+    # firmware computes in C. The reference is the last frame accepted, not the previous one,
+    # so that slow drifts still add up. After max_skip rejected frames one is accepted anyway.
+    # threshold=0 disables the detector (every frame is accepted).
+    def __init__(self, threshold, max_skip=30, bins=16):
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.bins = bins
+        self.reference = None
+        self.skipped = 0
+        self.last_difference = 0.0
+
+    def changed(self, img):
+        if self.threshold <= 0:
+            return True
+
+        bins = img.get_histogram(bins=self.bins).l_bins()
+        reference = self.reference
+        if reference is not None and self.skipped < self.max_skip:
+            difference = 0.0
+            for x, y in zip(bins, reference):
+                difference += abs(x - y)
+            self.last_difference = difference
+            if difference < self.threshold:
+                self.skipped += 1
+                return False
+
+        self.reference = bins
+        self.skipped = 0
+        return True
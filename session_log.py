@@ -0,0 +1,187 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+try:
+    import ustruct as struct
+except ImportError:
+    import struct
+
+try:
+    import uos as os
+except ImportError:
+    import os
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+import time
+
+from matcher import QUANT_BINARY, QUANT_INT4, QUANT_INT8
+
+
+# File layout (little endian), written once per session and then only appended to:
+#   header: magic(4s), version(H), dim(H), then the settings of the recognition (SETTINGS)
+#   record: ticks_ms(I), frame(I), squared_norm(I), nearest(H), runner_up(H), decided(H),
+#           nearest_dist(f), runner_up_dist(f), decided_dist(f), qvec(dim bytes)
+# A record cut short by a power-off is ignored by read_session().
+SESSION_MAGIC = b"CHSL"
+SESSION_VERSION = 1
+SETTINGS = ("ENTER_THRESHOLD", "EXIT_THRESHOLD", "SEARCH_THRESHOLD", "SMOOTHING_ALPHA", "MIN_CLASS_THRESHOLD",
+    "SMOOTHING_WINDOW", "SMOOTHING_VOTES", "QUANTIZATION", "RERANK", "ADAPTIVE_THRESHOLDS")
+HEADER_FORMAT = "<4sHHfffffHHHHH"
+RECORD_FORMAT = "<IIIHHHfff"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+QUANTIZATIONS = (QUANT_INT8, QUANT_INT4, QUANT_BINARY)
+
+
+def next_session_path(log_dir):
+    # log_dir/session_1.bin, log_dir/session_2.bin, ...
+    try:
+        existing = os.listdir(log_dir)
+    except OSError:
+        os.mkdir(log_dir)
+        existing = []
+    n = 1
+    while ("session_%d.bin" % (n,)) in existing:
+        n += 1
+    return log_dir + "/session_%d.bin" % (n,)
+
+
+def read_session(path):
+    # (settings, records) of a session file; settings maps the names of SETTINGS to their values,
+    # records are (ticks_ms, frame, squared_norm, nearest, runner_up, decided, nearest_dist,
+    # runner_up_dist, decided_dist, qvec)
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER_SIZE:
+        raise ValueError("not a session log: " + path)
+    header = struct.unpack_from(HEADER_FORMAT, data, 0)
+    if header[0] != SESSION_MAGIC or header[1] != SESSION_VERSION:
+        raise ValueError("not a session log: " + path)
+    dim = header[2]
+    settings = dict(zip(SETTINGS, header[3:]))
+    for name in SETTINGS[:5]:
+        # stored as float32
+        settings[name] = round(settings[name], 6)
+    settings["QUANTIZATION"] = QUANTIZATIONS[settings["QUANTIZATION"]]
+    settings["ADAPTIVE_THRESHOLDS"] = settings["ADAPTIVE_THRESHOLDS"] != 0
+
+    records = []
+    size = RECORD_SIZE + dim
+    offset = HEADER_SIZE
+    while offset + size <= len(data):
+        values = struct.unpack_from(RECORD_FORMAT, data, offset)
+        records.append(values + (data[offset + RECORD_SIZE:offset + size],))
+        offset += size
+    return settings, records
+
+
+class SessionLog(object):
+    # Records the quantized vector, the match and the decision of each recognized frame, to replay
+    # the session on the host (python -m sim.replay).
+    # Records are packed into one of two preallocated buffers of `frames_per_write` records; a full
+    # buffer is appended to the file by a background thread while the other one fills, so the loop
+    # never waits for the SD card (without _thread it does, once per buffer). A record arriving while
+    # both buffers are full is dropped and counted. The file and the buffers are created with the
+    # first record, which gives the dimension of the vectors; if the file cannot be created, nothing
+    # is recorded.
+    def __init__(self, path, settings, frames_per_write=8, use_thread=True):
+        self.path = path
+        self.settings = []
+        for name in SETTINGS:
+            value = settings[name]
+            if name == "QUANTIZATION":
+                value = QUANTIZATIONS.index(value)
+            elif name == "ADAPTIVE_THRESHOLDS":
+                value = 1 if value else 0
+            self.settings.append(value)
+        self.frames_per_write = max(frames_per_write, 1)
+        self.use_thread = use_thread and _thread is not None
+        self.record_size = 0
+        self.buffers = None
+        self.current = 0
+        self.count = 0
+        self.busy = False
+        self.records = 0
+        self.dropped = 0
+        self.writes = 0
+        self.errors = 0
+
+    def _create(self, dim):
+        with open(self.path, "wb") as f:
+            f.write(struct.pack(HEADER_FORMAT, SESSION_MAGIC, SESSION_VERSION, dim, *self.settings))
+        self.record_size = RECORD_SIZE + dim
+        self.buffers = [bytearray(self.record_size * self.frames_per_write) for _ in range(2)]
+
+    def record(self, frame, sq, qvec, nearest, nearest_dist, runner_up, runner_up_dist, decided, decided_dist):
+        # returns False if the record was dropped
+        if self.buffers is None:
+            if self.path is None:
+                return False
+            try:
+                self._create(len(qvec))
+            except OSError:
+                self.errors += 1
+                self.path = None
+                return False
+        if self.count == self.frames_per_write:
+            # the other buffer is still being written
+            if self.busy:
+                self.dropped += 1
+                return False
+            self._flush()
+
+        buf = self.buffers[self.current]
+        offset = self.count * self.record_size
+        struct.pack_into(RECORD_FORMAT, buf, offset, time.ticks_ms() & 0xFFFFFFFF, frame, sq, nearest, runner_up,
+            decided, nearest_dist, runner_up_dist, decided_dist)
+        buf[offset + RECORD_SIZE:offset + self.record_size] = qvec
+        self.count += 1
+        self.records += 1
+        if self.count == self.frames_per_write and not self.busy:
+            self._flush()
+        return True
+
+    def _flush(self):
+        buf = self.buffers[self.current]
+        size = self.count * self.record_size
+        self.current = 1 - self.current
+        self.count = 0
+        self.busy = True
+        if self.use_thread:
+            _thread.start_new_thread(self._write, (buf, size))
+        else:
+            self._write(buf, size)
+
+    def _write(self, buf, size):
+        try:
+            # opened for each write: a power-off loses at most the buffers not written yet
+            with open(self.path, "ab") as f:
+                f.write(memoryview(buf)[:size])
+            self.writes += 1
+        except Exception:
+            self.errors += 1
+        self.busy = False
+
+    def close(self):
+        # writes the remaining records in the calling thread
+        while self.busy:
+            time.sleep_ms(1)
+        if self.count > 0:
+            self.busy = True
+            self._write(self.buffers[self.current], self.count * self.record_size)
+            self.count = 0
@@ -0,0 +1,114 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Host-side simulation of the M5StickV environment.
+#
+#   import sim
+#   root = sim.make_sd_card("/tmp/sd", classes=10)
+#   result = sim.run_boot(root, frames=100)
+#
+# Fake MaixPy modules (sensor, KPU, lcd, image, audio, machine, Maix, fpioa_manager, uos)
+# live in sim/fakes and are put on sys.path by sim.install().
+
+import os
+import struct
+import sys
+
+from sim.hub import FakeHub
+from sim.runtime import FEATURE_DIM, install, state, uninstall, write_sim_image
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOOT_PATH = os.path.join(ROOT_DIR, "boot.py")
+MODEL_FILE = "model/mbnet751_feature.kmodel"
+
+# GPIO numbers of the buttons and the UART used by boot.py
+BUTTON_A = 1
+BUTTON_B = 2
+HUB_UART = 2
+
+
+class SimResult(object):
+    def __init__(self, globals_dict, counters, frames, hub):
+        self.globals = globals_dict
+        self.counters = counters
+        self.frames = frames
+        self.hub = hub
+
+
+def scene_seed(class_num):
+    return 1000 + class_num
+
+
+def make_sd_card(root, classes=10, seeds=None):
+    os.makedirs(os.path.join(root, "images"), exist_ok=True)
+    os.makedirs(os.path.join(root, "model"), exist_ok=True)
+    model_path = os.path.join(root, MODEL_FILE)
+    if not os.path.exists(model_path):
+        with open(model_path, "wb") as f:
+            f.write(b"sim model")
+
+    for class_num in range(1, classes + 1):
+        seed = seeds[class_num - 1] if seeds is not None else scene_seed(class_num)
+        write_sim_image(os.path.join(root, "images", "%d.jpg" % class_num), seed)
+    return root
+
+
+def save_recording(path, vectors):
+    with open(path, "wb") as f:
+        for vec in vectors:
+            f.write(struct.pack("<%df" % len(vec), *vec))
+
+
+def load_recording(path, dim=FEATURE_DIM):
+    with open(path, "rb") as f:
+        data = f.read()
+    size = 4 * dim
+    return [list(struct.unpack_from("<%df" % dim, data, offset))
+            for offset in range(0, len(data) - size + 1, size)]
+
+
+def run_script(path, **kwargs):
+    install(**kwargs)
+    g = {"__name__": "__main__", "__file__": path}
+    hub = state.hubs.get(HUB_UART)
+    try:
+        with open(path) as f:
+            code = compile(f.read(), path, "exec")
+        try:
+            exec(code, g)
+        except SystemExit:
+            pass
+        return SimResult(g, dict(state.counters), state.frames, hub)
+    finally:
+        uninstall()
+
+
+def run_boot(sd_root, frames=100, config=None, buttons=None, hub=None, **kwargs):
+    gpio_inputs = {}
+    for name, value in (buttons or {}).items():
+        gpio_inputs[BUTTON_A if name == "A" else BUTTON_B] = value
+    hubs = {HUB_UART: hub} if hub is not None else None
+    if ROOT_DIR not in sys.path:
+        sys.path.append(ROOT_DIR)
+    return run_script(BOOT_PATH, sd_root=sd_root, max_frames=frames, config=config,
+        gpio_inputs=gpio_inputs, hubs=hubs, **kwargs)
+
+
+def connect_device(device_class, hub, tx_pin=34, rx_pin=35, **kwargs):
+    # runs the handshake of SpikePrimeDevice or MindstromsDevice against hub;
+    # install() must have been called with hubs={HUB_UART: hub}
+    device = device_class(tx_pin=tx_pin, rx_pin=rx_pin, **kwargs)
+    device.initialize()
+    return device
@@ -0,0 +1,79 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Runs boot.py (or one LPF2 handshake) against the fakes.
+#
+#   python -m sim --classes 10 --frames 100
+#   python -m sim --device spike
+
+import argparse
+import shutil
+import tempfile
+
+import sim
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run cheese on the host with fake MaixPy modules")
+    parser.add_argument("--sd", help="SD card directory (default: a temporary card with --classes images)")
+    parser.add_argument("--classes", type=int, default=10)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--noise", type=float, default=0.2)
+    parser.add_argument("--recording", help="float32 feature recording returned by the fake KPU")
+    parser.add_argument("--no-hub", action="store_true", help="do not connect to the LPF2 hub")
+    parser.add_argument("--camera-mode", action="store_true", help="start with button B held")
+    parser.add_argument("--device", choices=["boot", "spike", "mindstorms"], default="boot",
+        help="run boot.py, or only the handshake of one device class")
+    args = parser.parse_args()
+
+    sd_root = args.sd
+    if sd_root is None:
+        sd_root = sim.make_sd_card(tempfile.mkdtemp(prefix="cheese-sd-"), classes=max(args.classes, 0))
+
+    recording = sim.load_recording(args.recording) if args.recording else None
+
+    try:
+        if args.device == "boot":
+            buttons = {}
+            if args.no_hub:
+                buttons["A"] = 0
+            if args.camera_mode:
+                buttons["B"] = 0
+            hub = sim.FakeHub()
+            result = sim.run_boot(sd_root, frames=args.frames, buttons=buttons, hub=hub,
+                noise=args.noise, recording=recording)
+            print("frames: %d" % result.frames)
+            for name in sorted(result.counters):
+                print("%s: %d" % (name, result.counters[name]))
+            print("hub connected: %s, data frames: %d" % (hub.connected, len(hub.data_frames)))
+        else:
+            hub = sim.FakeHub()
+            sim.install(sd_root, hubs={sim.HUB_UART: hub})
+            try:
+                if args.device == "spike":
+                    from LPF2 import SpikePrimeDevice as device_class
+                else:
+                    from LPF2_mindstorms import MindstromsDevice as device_class
+                device = sim.connect_device(device_class, hub)
+                print("connected: %s, handshake bytes: %d, info messages: %d, checksum errors: %d" % (
+                    device.connected, hub.handshake_bytes, hub.info_messages, hub.checksum_errors))
+            finally:
+                sim.uninstall()
+    finally:
+        if args.sd is None:
+            shutil.rmtree(sd_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
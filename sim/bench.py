@@ -0,0 +1,117 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Frame-time benchmark of the recognition loop of boot.py on the host fakes.
+#
+#   python -m sim.bench --classes 10 50 200 --frames 100
+#   python -m sim.bench --save baseline.json
+#   python -m sim.bench --compare baseline.json --tolerance 0.2
+#   python -m sim.bench --classes 10 --delays snapshot=20,forward=45,display=15 --pipeline
+#
+# Host timings do not predict K210 timings; they are meant for comparing class counts
+# and for catching regressions in the Python parts of the loop (quantize, match, ...).
+# --delays gives the fake snapshot/forward/display a duration (ms) so that the serial and
+# the pipelined loop (PIPELINE with the asynchronous KPU interface) can be compared.
+
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+
+import sim
+
+
+def parse_delays(text):
+    delays = {}
+    for item in (text or "").split(","):
+        if item:
+            name, ms = item.split("=")
+            delays[name.strip()] = float(ms) / 1000.0
+    return delays
+
+
+def run(classes, frames, config=None, hub=True, **kwargs):
+    sd_root = sim.make_sd_card(tempfile.mkdtemp(prefix="cheese-bench-"), classes=classes)
+    try:
+        settings = {"MAX_CLASS": max(classes, 1), "BENCHMARK_FRAMES": frames}
+        settings.update(config or {})
+        # the pipelined loop needs one more frame to fill the pipeline
+        result = sim.run_boot(sd_root, frames=frames + 1, config=settings,
+            hub=sim.FakeHub() if hub else None, buttons=None if hub else {"A": 0}, **kwargs)
+        return result.globals["profiler"]
+    finally:
+        shutil.rmtree(sd_root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage frame-time benchmark on the host fakes")
+    parser.add_argument("--classes", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--no-hub", action="store_true")
+    parser.add_argument("--delays", help="durations of the fake device operations, e.g. forward=45,display=15 (ms)")
+    parser.add_argument("--pipeline", action="store_true", help="compare the serial and the pipelined loop")
+    parser.add_argument("--csv", help="write the per-frame samples of each run to CSV_<classes>.csv")
+    parser.add_argument("--save", help="save p50 per stage to a JSON baseline")
+    parser.add_argument("--compare", help="compare p50 of the total against a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    delays = parse_delays(args.delays)
+    if args.pipeline:
+        for classes in args.classes:
+            fps = []
+            for pipeline in (False, True):
+                print("== %d classes, %s ==" % (classes, "pipelined" if pipeline else "serial"))
+                profiler = run(classes, args.frames, config={"PIPELINE": pipeline}, hub=not args.no_hub,
+                    delays=delays, kpu_async=True)
+                fps.append(profiler.fps())
+            print("%d classes: %0.2f -> %0.2f fps (x%0.2f)" % (classes, fps[0], fps[1],
+                fps[1] / fps[0] if fps[0] else 0.0))
+        return
+
+    results = {}
+    for classes in args.classes:
+        print("== %d classes ==" % classes)
+        # boot.py prints the report itself when the last frame has been measured
+        profiler = run(classes, args.frames, hub=not args.no_hub, delays=delays)
+        if args.csv:
+            profiler.save_csv("%s_%d.csv" % (args.csv, classes))
+        results[str(classes)] = dict((name, p50) for name, p50, _, _, _ in profiler.summary())
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressed = False
+        for classes, stages in sorted(results.items()):
+            if classes not in baseline:
+                continue
+            before = baseline[classes]["total"]
+            after = stages["total"]
+            ratio = float(after) / before if before else 1.0
+            mark = ""
+            if ratio > 1.0 + args.tolerance:
+                mark = "  REGRESSION"
+                regressed = True
+            print("%s classes: total p50 %d -> %d us (x%0.2f)%s" % (classes, before, after, ratio, mark))
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Benchmark of the class index (matcher.ClassIndex) against the exhaustive scan
+# (FeatureMatcher.top_k) with several prototypes per class.
+#
+#   python -m sim.bench_index --classes 200 --prototypes 5 --queries 50
+#   python -m sim.bench_index --adaptive 0.3
+#
+# --adaptive derives per-class thresholds (ClassThresholds) with this maximum, as boot.py does
+# with ADAPTIVE_THRESHOLDS, and applies them to both searches.
+# Every query must give the same top-k with both; the run fails otherwise.
+
+import argparse
+import random
+import sys
+import time
+
+from sim.runtime import FEATURE_DIM
+
+from class_thresholds import ClassThresholds
+from matcher import ClassIndex, FeatureMatcher
+from quantizer import Quantizer
+
+
+def make_vectors(seed, count, noise, base=None):
+    r = random.Random(seed)
+    if base is None:
+        base = [r.gauss(0.0, 1.0) for _ in range(FEATURE_DIM)]
+    return base, [[x + r.gauss(0.0, noise) for x in base] for _ in range(count)]
+
+
+def build(classes, prototypes, noise, seed):
+    quantizer = Quantizer()
+    matcher = FeatureMatcher()
+    bases = []
+    for class_num in range(1, classes + 1):
+        base, vectors = make_vectors(seed + class_num, prototypes, noise)
+        bases.append(base)
+        for vec in vectors:
+            l, qvec = quantizer.quantize(vec)
+            matcher.add(l, bytearray(qvec), class_num)
+    return matcher, bases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Class index vs. exhaustive scan")
+    parser.add_argument("--classes", type=int, default=200)
+    parser.add_argument("--prototypes", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--noise", type=float, default=0.5, help="spread of the prototypes and queries")
+    parser.add_argument("--threshold", type=float, default=0.5, help="0 to search without a threshold")
+    parser.add_argument("--adaptive", type=float, default=0.0, help="> 0: per-class thresholds up to this")
+    parser.add_argument("--seed", type=int, default=1000)
+    parser.add_argument("--no-numpy", action="store_true")
+    args = parser.parse_args()
+    threshold = args.threshold if args.threshold > 0 else None
+
+    matcher, bases = build(args.classes, args.prototypes, args.noise, args.seed)
+    matcher.use_numpy = matcher.use_numpy and not args.no_numpy
+    t = time.perf_counter()
+    index = ClassIndex(matcher)
+    print("%d classes x %d prototypes, index built in %0.2f s" % (args.classes, args.prototypes,
+        time.perf_counter() - t))
+    if args.adaptive > 0:
+        t = time.perf_counter()
+        thresholds = ClassThresholds(args.classes, args.adaptive, min(0.1, args.adaptive), 0.05)
+        thresholds.compute(index)
+        matcher.class_thresholds = index.class_thresholds = thresholds.limits
+        print("per-class thresholds derived in %0.2f s, %d below %0.2f" % (time.perf_counter() - t,
+            len([c for c in range(1, args.classes + 1) if thresholds.values[c] < args.adaptive]), args.adaptive))
+
+    quantizer = Quantizer()
+    r = random.Random(args.seed)
+    exhaustive_time = 0.0
+    index_time = 0.0
+    visited = 0
+    mismatches = 0
+    for n in range(args.queries):
+        class_num = r.randint(1, args.classes)
+        _, (vec,) = make_vectors(args.seed * 7 + n, 1, args.noise, bases[class_num - 1])
+        l, qvec = quantizer.quantize(vec)
+
+        t = time.perf_counter()
+        expected = matcher.top_k(l, qvec, args.k, threshold)
+        exhaustive_time += time.perf_counter() - t
+
+        t = time.perf_counter()
+        actual = index.top_k(l, qvec, args.k, threshold)
+        index_time += time.perf_counter() - t
+        visited += index.visited
+
+        if actual != expected:
+            mismatches += 1
+            print("query %d (class %d): exhaustive %r, index %r" % (n, class_num, expected, actual))
+
+    queries = float(args.queries)
+    print("exhaustive: %8.2f ms/query, %d rows" % (exhaustive_time / queries * 1000, matcher.count))
+    print("index:      %8.2f ms/query, %0.1f rows + %d centers" % (index_time / queries * 1000,
+        visited / queries, index.centers.count))
+    print("speedup:    x%0.2f, mismatches: %d" % (exhaustive_time / index_time if index_time else 0.0,
+        mismatches))
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Accuracy vs. speed of the quantization schemes (QUANTIZATION / RERANK in boot.py).
+#
+#   python -m sim.bench_quant --recordings DIR --prototypes 1
+#   python -m sim.bench_quant --classes 200 --save DIR
+#
+# DIR holds one feature recording per class, class_<N>.bin (the format of sim.save_recording).
+# The first --prototypes vectors of each class are enrolled, the others are queries.
+# Without --recordings, vectors are drawn like the fake KPU does (scene + noise per frame).
+
+import argparse
+import os
+import random
+import re
+import time
+
+import sim
+from sim.runtime import FEATURE_DIM
+
+from matcher import QUANT_BINARY, QUANT_INT4, QUANT_INT8, ClassIndex, FeatureMatcher, pack_matcher
+from quantizer import Quantizer
+
+
+def synthesize(classes, vectors, noise, seed):
+    recordings = {}
+    for class_num in range(1, classes + 1):
+        r = random.Random(seed + class_num)
+        base = [r.gauss(0.0, 1.0) for _ in range(FEATURE_DIM)]
+        recordings[class_num] = [[x + r.gauss(0.0, noise) for x in base] for _ in range(vectors)]
+    return recordings
+
+
+def load_recordings(path):
+    recordings = {}
+    for name in os.listdir(path):
+        m = re.match(r"class_(\d+)\.bin$", name)
+        if m:
+            recordings[int(m.group(1))] = sim.load_recording(os.path.join(path, name))
+    return recordings
+
+
+def schemes(reranks):
+    yield QUANT_INT8, 0
+    for scheme in (QUANT_INT4, QUANT_BINARY):
+        yield scheme, 0
+        for rerank in reranks:
+            yield scheme, rerank
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy vs. speed of the quantization schemes")
+    parser.add_argument("--recordings", help="directory of class_<N>.bin feature recordings")
+    parser.add_argument("--classes", type=int, default=200)
+    parser.add_argument("--vectors", type=int, default=3, help="vectors per class when synthesizing")
+    parser.add_argument("--noise", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=1000)
+    parser.add_argument("--save", help="save the synthesized vectors as recordings to this directory")
+    parser.add_argument("--prototypes", type=int, default=1)
+    parser.add_argument("--rerank", type=int, nargs="*", default=[5, 20])
+    parser.add_argument("--max-queries", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.recordings:
+        recordings = load_recordings(args.recordings)
+    else:
+        recordings = synthesize(args.classes, args.vectors, args.noise, args.seed)
+        if args.save:
+            os.makedirs(args.save, exist_ok=True)
+            for class_num, vectors in recordings.items():
+                sim.save_recording(os.path.join(args.save, "class_%d.bin" % class_num), vectors)
+
+    quantizer = Quantizer()
+    matcher = FeatureMatcher()
+    queries = []
+    for class_num in sorted(recordings):
+        for n, vec in enumerate(recordings[class_num]):
+            l, qvec = quantizer.quantize(vec)
+            if n < args.prototypes:
+                matcher.add(l, bytearray(qvec), class_num)
+            else:
+                queries.append((class_num, l, bytearray(qvec)))
+    queries = random.Random(args.seed).sample(queries, min(args.max_queries, len(queries)))
+    print("%d classes, %d prototypes, %d queries" % (len(recordings), matcher.count, len(queries)))
+
+    print("%-8s %6s %10s %10s %10s %10s" % ("scheme", "rerank", "bytes/row", "accuracy", "= int8", "ms/query"))
+    reference = None
+    for scheme, rerank in schemes(args.rerank):
+        if scheme == QUANT_INT8:
+            index = ClassIndex(matcher)
+            row_bytes = matcher.dim + 4 + 2
+        else:
+            index = pack_matcher(matcher, scheme, rerank)
+            row_bytes = index.code_size + 4 + 2 + (matcher.dim + 4 + 2 if rerank else 0)
+
+        results = []
+        t = time.perf_counter()
+        for class_num, l, qvec in queries:
+            results.append(index.nearest(l, qvec)[0])
+        elapsed = time.perf_counter() - t
+        if reference is None:
+            reference = results
+
+        correct = sum(1 for (class_num, _, _), result in zip(queries, results) if result == class_num)
+        agree = sum(1 for a, b in zip(reference, results) if a == b)
+        n = float(len(queries)) or 1.0
+        print("%-8s %6d %10d %9.1f%% %9.1f%% %10.2f" % (scheme, rerank, row_bytes, correct / n * 100,
+            agree / n * 100, elapsed / n * 1000))
+
+
+if __name__ == "__main__":
+    main()
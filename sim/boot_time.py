@@ -0,0 +1,71 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Start-up time of boot.py against the fake hub, with and without FAST_BOOT.
+#
+#   python -m sim.boot_time --classes 10
+#   python -m sim.boot_time --delays camera=300,load=1200,forward=45 --cold
+#
+# Sleeps run in real time here, and --delays gives the camera reset, the model load and the
+# forward pass a duration (ms). The camera shows class 1 from the first frame, so the first
+# detection is reported as soon as the smoothing lets it through. --cold removes the feature
+# cache before each run.
+
+import argparse
+import os
+import shutil
+import tempfile
+
+import sim
+from sim.bench import parse_delays
+
+
+def run(sd_root, fast_boot, frames, delays):
+    result = sim.run_boot(sd_root, frames=frames, config={"FAST_BOOT": fast_boot}, hub=sim.FakeHub(),
+        time_scale=1.0, delays=delays, scenes=[sim.scene_seed(1)])
+    return dict(result.globals.get("boot_times", []))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start-up time of boot.py with and without FAST_BOOT")
+    parser.add_argument("--classes", type=int, default=10)
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--delays", default="camera=300,load=1000",
+        help="durations of the fake device operations, e.g. camera=300,load=1000,forward=45 (ms)")
+    parser.add_argument("--cold", action="store_true", help="extract the features again in each run")
+    args = parser.parse_args()
+
+    delays = parse_delays(args.delays)
+    sd_root = sim.make_sd_card(tempfile.mkdtemp(prefix="cheese-boot-"), classes=args.classes)
+    stages = ("camera", "model", "features", "hub", "first frame", "first detection")
+    try:
+        if not args.cold:
+            # warm the feature cache
+            run(sd_root, True, 1, {})
+        print("%-10s" % "" + "".join(["%16s" % x for x in stages]))
+        for fast_boot in (False, True):
+            if args.cold:
+                try:
+                    os.remove(os.path.join(sd_root, "features.bin"))
+                except OSError:
+                    pass
+            times = run(sd_root, fast_boot, args.frames, delays)
+            print("%-10s" % ("fast" if fast_boot else "serial") +
+                "".join(["%13s ms" % (times[x] if x in times else "-") for x in stages]))
+    finally:
+        shutil.rmtree(sd_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
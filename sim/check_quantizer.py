@@ -0,0 +1,119 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Regression check of Quantizer.quantize() and Quantizer.quantize_fmap() against the reference
+# quantize_vector(): random vectors of several scales and the edge cases (all zeros, saturating
+# values, a single non-zero value, ties of the largest magnitude). All three must return the same
+# bytes and norm, or raise the same exception.
+#
+#   python -m sim.check_quantizer --iterations 2000
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quantizer import Quantizer, quantize_vector
+
+
+DIM = 768
+
+
+class FeatureMap(object):
+    # indexable like the output of KPU.forward(), without slicing
+    def __init__(self, values):
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+
+def edge_cases(dim):
+    cases = [
+        ("zeros", [0.0] * dim),
+        ("saturating", [1.0 if i % 2 else -1.0 for i in range(dim)]),
+        ("positive max", [3.5] + [0.0] * (dim - 1)),
+        ("negative max", [0.0] * (dim - 1) + [-3.5]),
+        ("tie", [2.0, -2.0] + [0.5] * (dim - 2)),
+        ("huge", [1e30 * ((i % 7) - 3) for i in range(dim)]),
+        ("tiny", [1e-30 * ((i % 5) - 2) for i in range(dim)]),
+        ("integers", [(i % 255) - 127 for i in range(dim)]),
+    ]
+    return cases
+
+
+def random_vector(r, dim):
+    scale = 10 ** r.uniform(-6, 6)
+    kind = r.randrange(3)
+    if kind == 0:
+        return [r.gauss(0.0, scale) for _ in range(dim)]
+    if kind == 1:
+        # non-negative like a ReLU output
+        return [max(0.0, r.gauss(0.0, scale)) for _ in range(dim)]
+    return [r.uniform(-scale, scale) for _ in range(dim)]
+
+
+def outcome(quantize, vec):
+    try:
+        l, qvec = quantize(vec)
+    except Exception as e:
+        return type(e).__name__
+    return l, bytes(qvec)
+
+
+def check(name, vec):
+    quantizer = Quantizer()
+    expected = outcome(quantize_vector, vec)
+    results = (("quantize", outcome(quantizer.quantize, vec)),
+        ("quantize_fmap", outcome(quantizer.quantize_fmap, FeatureMap(vec))))
+    for method, result in results:
+        if isinstance(expected, str) or isinstance(result, str):
+            assert result == expected, "%s: %s gives %s, quantize_vector %s" % (name, method, result, expected)
+            continue
+        assert result[1] == expected[1], "%s: %s differs from quantize_vector" % (name, method)
+        assert abs(result[0] - expected[0]) <= 1e-9 * max(1.0, expected[0]), \
+            "%s: %s norm %r, quantize_vector %r" % (name, method, result[0], expected[0])
+        if method == "quantize_fmap":
+            assert quantizer.squared_norm == sum([(x - 127) ** 2 for x in expected[1]])
+    return expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the quantizers with quantize_vector()")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=DIM)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, vec in edge_cases(args.dim):
+        result = check(name, vec)
+        if isinstance(result, str):
+            print("%-14s all raise %s" % (name, result))
+        else:
+            print("%-14s ok (qvec %d..%d)" % (name, min(result[1]), max(result[1])))
+
+    r = random.Random(args.seed)
+    for n in range(args.iterations):
+        check("random vector %d" % (n,), random_vector(r, r.choice([1, 2, 3, args.dim])))
+    print("ok: %d edge cases and %d random vectors" % (len(edge_cases(args.dim)), args.iterations))
+
+
+if __name__ == "__main__":
+    main()
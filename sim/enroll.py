@@ -0,0 +1,267 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Batch enrollment on the host: builds the images directory, the feature cache and the per-class
+# thresholds of an SD card from a directory of labeled photos, instead of taking each photo in
+# camera mode and extracting the features at boot.
+#
+#   python -m sim.enroll photos/ --out sdcard/ --backend onnx --backend-model mbnet751.onnx
+#   python -m sim.enroll photos/ --out sdcard/ --backend pixels --jobs 8
+#
+# photos/ holds one directory per class (photos/3/*.jpg, or named directories, numbered in sorted
+# order and listed in sdcard/classes.txt) and/or single photos named after their class (3.jpg).
+# Each photo gets the 224x224 window of the camera (scaled to cover 320x240, centered), is saved as
+# sdcard/images/N.jpg, N/1.jpg, ... and its feature is quantized like on the device. Copy the
+# contents of sdcard/ to the SD card: boot.py finds every image in features.bin (the pack records
+# the size of --kmodel and of the images, not their times) and loads the features directly.
+#
+# Backends (--backend), run in a process pool of --jobs processes:
+#   onnx    mbnet751 exported to ONNX (--backend-model; input 1x3x224x224 in [-1, 1], output 768
+#           values), needs onnxruntime, numpy and Pillow; the K210 runs a quantized model, so the
+#           distances differ slightly from features extracted on the device
+#   pixels  stand-in without a model: the centered 16x16 RGB thumbnail of the window (768 values),
+#           needs Pillow; only for trying out the pipeline
+#   sim     the fake KPU of the simulation, for the images of sim.make_sd_card
+#   module:Class  any class with __init__(model_path), prepare(src, dst) returning the input of
+#           features(input), which returns the feature vector
+
+import argparse
+import importlib
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+from sim import MODEL_FILE, ROOT_DIR
+
+from class_thresholds import ClassThresholds
+from feature_cache import write_entries
+from matcher import ClassIndex, FeatureMatcher
+from quantizer import Quantizer
+
+
+SD_IMAGES_DIR = "/sd/images"
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def window(path):
+    # the camera frame: scaled to cover QVGA, then the centered 224x224 window (sensor.set_windowing)
+    img = Image.open(path).convert("RGB")
+    scale = max(320.0 / img.width, 240.0 / img.height)
+    img = img.resize((max(320, int(round(img.width * scale))), max(240, int(round(img.height * scale)))),
+        Image.BILINEAR)
+    left = (img.width - 224) // 2
+    top = (img.height - 224) // 2
+    return img.crop((left, top, left + 224, top + 224))
+
+
+class PixelBackend(object):
+    def __init__(self, model_path=None):
+        if Image is None:
+            raise RuntimeError("the pixels and onnx backends need Pillow")
+
+    def prepare(self, src, dst):
+        img = window(src)
+        img.save(dst, quality=95)
+        return img
+
+    def features(self, img):
+        values = []
+        for pixel in img.resize((16, 16), Image.BILINEAR).getdata():
+            values.extend(pixel)
+        mean = float(sum(values)) / len(values)
+        return [x - mean for x in values]
+
+
+class OnnxBackend(PixelBackend):
+    def __init__(self, model_path=None):
+        PixelBackend.__init__(self, model_path)
+        if onnxruntime is None or np is None:
+            raise RuntimeError("the onnx backend needs onnxruntime and numpy")
+        if model_path is None:
+            raise RuntimeError("the onnx backend needs --backend-model")
+        self.session = onnxruntime.InferenceSession(model_path)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def features(self, img):
+        x = np.asarray(img, dtype=np.float32) / 127.5 - 1.0
+        output = self.session.run(None, {self.input_name: x.transpose(2, 0, 1)[np.newaxis]})[0]
+        return output.reshape(-1).tolist()
+
+
+class SimBackend(object):
+    def __init__(self, model_path=None):
+        pass
+
+    def prepare(self, src, dst):
+        from sim.runtime import read_sim_seed
+        shutil.copyfile(src, dst)
+        return read_sim_seed(src)
+
+    def features(self, seed):
+        from sim.fakes.KPU import feature_of
+        return feature_of(seed)
+
+
+BACKENDS = {"onnx": OnnxBackend, "pixels": PixelBackend, "sim": SimBackend}
+
+
+def backend_class(name):
+    if name in BACKENDS:
+        return BACKENDS[name]
+    module_name, _, class_name = name.partition(":")
+    if not class_name:
+        raise ValueError("unknown backend: " + name)
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def list_photos(photo_dir):
+    # ([(class_num, [photo paths])], {class_num: directory name}) of a directory of labeled photos
+    photos = {}
+    named = []
+    for name in sorted(os.listdir(photo_dir)):
+        path = os.path.join(photo_dir, name)
+        stem, ext = os.path.splitext(name)
+        if os.path.isdir(path):
+            files = [os.path.join(path, x) for x in sorted(os.listdir(path)) if x.lower().endswith(PHOTO_EXTENSIONS)]
+            if stem.isdigit():
+                photos.setdefault(int(stem), []).extend(files)
+            elif files:
+                named.append((name, files))
+        elif ext.lower() in PHOTO_EXTENSIONS and stem.isdigit():
+            # N.jpg comes first, as on the device
+            photos.setdefault(int(stem), []).insert(0, path)
+
+    labels = {}
+    class_num = max(list(photos) + [0])
+    for name, files in named:
+        class_num += 1
+        photos[class_num] = files
+        labels[class_num] = name
+    return [(c, photos[c]) for c in sorted(photos) if photos[c]], labels
+
+
+def plan(classes, out_dir):
+    # [(photo, host path of the image, device path of the image, class_num)]
+    jobs = []
+    for class_num, files in classes:
+        for n in range(len(files)):
+            if n == 0:
+                name = "%d.jpg" % (class_num,)
+            else:
+                name = "%d/%d.jpg" % (class_num, n)
+                os.makedirs(os.path.join(out_dir, "images", str(class_num)), exist_ok=True)
+            jobs.append((files[n], os.path.join(out_dir, "images", name), SD_IMAGES_DIR + "/" + name, class_num))
+    return jobs
+
+
+_backend = None
+
+
+def _init_worker(name, model_path):
+    global _backend
+    _backend = backend_class(name)(model_path)
+
+
+def _extract(job):
+    src, dst, image_path, class_num = job
+    quantizer = Quantizer()
+    _, qvec = quantizer.quantize(_backend.features(_backend.prepare(src, dst)))
+    return image_path, class_num, os.path.getsize(dst), quantizer.squared_norm, bytes(qvec)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the images and the feature pack of an SD card from photos")
+    parser.add_argument("photos", help="directory of labeled photos")
+    parser.add_argument("--out", required=True, help="output directory, copied to the SD card")
+    parser.add_argument("--backend", default="onnx", help="onnx, pixels, sim or module:Class")
+    parser.add_argument("--backend-model", help="model file of the backend")
+    parser.add_argument("--kmodel", default=os.path.join(ROOT_DIR, MODEL_FILE),
+        help="the kmodel of the SD card, which the pack is valid for")
+    parser.add_argument("--jobs", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--overwrite", action="store_true", help="replace the images directory of --out")
+    parser.add_argument("--threshold", type=float, default=0.3,
+        help="largest SIMILARITY_THRESHOLD the per-class thresholds are derived for")
+    args = parser.parse_args()
+
+    classes, labels = list_photos(args.photos)
+    if not classes:
+        sys.exit("no photos in " + args.photos)
+    try:
+        # fails early, before the pool starts
+        backend_class(args.backend)(args.backend_model)
+    except (RuntimeError, ValueError, ImportError, AttributeError) as e:
+        sys.exit(str(e))
+
+    images_dir = os.path.join(args.out, "images")
+    if os.path.exists(images_dir):
+        # images left from another set would be extracted again on the device
+        if not args.overwrite:
+            sys.exit("%s exists; remove it or pass --overwrite" % (images_dir,))
+        shutil.rmtree(images_dir)
+    os.makedirs(images_dir)
+    jobs = plan(classes, args.out)
+
+    start = time.perf_counter()
+    pool = multiprocessing.Pool(args.jobs, _init_worker, (args.backend, args.backend_model))
+    try:
+        entries = pool.map(_extract, jobs, chunksize=max(1, len(jobs) // (args.jobs * 4)))
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = time.perf_counter() - start
+
+    dim = len(entries[0][4])
+    write_entries(os.path.join(args.out, "features.bin"), dim, entries, os.path.getsize(args.kmodel))
+
+    # the per-class thresholds of ADAPTIVE_THRESHOLDS, so that the device does not derive them
+    max_class = classes[-1][0]
+    matcher = FeatureMatcher(capacity=len(entries))
+    for image_path, class_num, _, sq, qvec in sorted(entries, key=lambda x: (x[1], x[0])):
+        matcher.add(sq ** 0.5, bytearray(qvec), class_num)
+    thresholds = ClassThresholds(max_class, args.threshold)
+    thresholds.compute(ClassIndex(matcher))
+    thresholds.save(os.path.join(args.out, "thresholds.bin"))
+
+    if labels:
+        with open(os.path.join(args.out, "classes.txt"), "w") as f:
+            for class_num in sorted(labels):
+                f.write("%d %s\n" % (class_num, labels[class_num]))
+
+    print("%d photos of %d classes, %d dimensions: %0.1f s with %d processes (%0.1f photos/s)" % (len(entries),
+        len(classes), dim, elapsed, args.jobs, len(entries) / elapsed if elapsed > 0 else 0))
+    for class_num in sorted(labels):
+        print("  class %3d: %s" % (class_num, labels[class_num]))
+    if max_class > 10:
+        print("set MAX_CLASS = %d in config.py" % (max_class,))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fake of MaixPy's KPU module. forward() returns a deterministic feature vector:
+# either the next vector of a recording (state.recording) or a seeded random vector per
+# scene plus seeded noise per frame, so that frames of the same scene are close in cosine distance.
+# An image showing its object in part of the frame gets the object's vector blended with the empty
+# background's (seed 0) by the fraction of the image the object covers.
+# run()/poll() (the asynchronous interface) only exist when state.kpu_async is set.
+
+import os
+import random
+import threading
+
+from sim.runtime import FEATURE_DIM, delay, host_path, state
+
+
+_base_features = {}
+
+
+class _Task(object):
+    def __init__(self, path):
+        self.path = path
+        self.thread = None
+        self.output = None
+
+
+class _FeatureMap(object):
+    def __init__(self, values):
+        self.values = values
+        self.freed = False
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def __iter__(self):
+        return iter(self.values)
+
+
+def base_feature(seed):
+    vec = _base_features.get(seed)
+    if vec is None:
+        r = random.Random(seed)
+        vec = [r.gauss(0.0, 1.0) for _ in range(FEATURE_DIM)]
+        _base_features[seed] = vec
+    return vec
+
+
+def feature_of(seed, frame=0):
+    vec = base_feature(seed)
+    if frame == 0 or state.noise <= 0:
+        return list(vec)
+    r = random.Random(seed * 1000003 + frame)
+    noise = state.noise
+    return [x + r.gauss(0.0, noise) for x in vec]
+
+
+def load(path):
+    if isinstance(path, str) and not os.path.exists(host_path(path)):
+        raise ValueError("[MAIXPY]kpu: open error")
+    state.count("kpu.load")
+    delay("load")
+    return _Task(path)
+
+
+def netinfo(task):
+    return []
+
+
+def _coverage(window, roi):
+    x, y, w, h = window
+    rx, ry, rw, rh = roi
+    overlap = max(0, min(x + w, rx + rw) - max(x, rx)) * max(0, min(y + h, ry + rh) - max(y, ry))
+    return float(overlap) / (w * h)
+
+
+def _output(img):
+    if state.recording:
+        vec = state.recording[state.recording_index % len(state.recording)]
+        state.recording_index += 1
+        return _FeatureMap(list(vec))
+    object_roi = getattr(img, "object_roi", None)
+    if object_roi is None:
+        return _FeatureMap(feature_of(img.seed, img.frame))
+    f = _coverage(img.window, object_roi)
+    background = feature_of(0, img.frame)
+    return _FeatureMap([f * a + (1.0 - f) * b for a, b in zip(base_feature(img.seed), background)])
+
+
+def forward(task, img, layer=None):
+    state.count("kpu.forward")
+    delay("forward")
+    return _output(img)
+
+
+def run(task, img):
+    if task.thread is not None:
+        raise RuntimeError("[MAIXPY]kpu: busy")
+    state.count("kpu.run")
+
+    # the KPU reads its input while it runs; the fake reads it when the result is collected, so an
+    # input overwritten in the meantime (the next snapshot) shows up in the feature
+    def work():
+        delay("forward")
+        task.output = img
+
+    task.output = None
+    task.thread = threading.Thread(target=work, daemon=True)
+    task.thread.start()
+
+
+def poll(task):
+    if task.thread is None or task.output is None:
+        return None
+    task.thread = None
+    output = _output(task.output)
+    task.output = None
+    return output
+
+
+def fmap_free(fmap):
+    state.count("kpu.fmap_free")
+    fmap.freed = True
+
+
+def deinit(task):
+    pass
+
+
+if not state.kpu_async:
+    del run, poll
@@ -0,0 +1,63 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fake of MaixPy's Maix module. GPIO inputs read from sim state, so buttons can be scripted:
+# state.gpio_inputs maps a GPIO number to a value or to a callable returning the value.
+
+from sim.runtime import state
+
+
+class GPIO(object):
+    GPIO0, GPIO1, GPIO2, GPIO3, GPIO4, GPIO5, GPIO6, GPIO7 = range(8)
+    IN = 0
+    OUT = 3
+    PULL_NONE = 0
+    PULL_DOWN = 1
+    PULL_UP = 2
+
+    def __init__(self, gpio, direction, pull=PULL_NONE):
+        self.gpio = gpio
+        self.direction = direction
+        self.pull = pull
+        self.output = 1
+
+    def value(self, value=None):
+        if value is not None:
+            self.output = value
+            return None
+        if self.direction == GPIO.OUT:
+            return self.output
+
+        level = state.gpio_inputs.get(self.gpio, 1 if self.pull == GPIO.PULL_UP else 0)
+        if callable(level):
+            level = level()
+        return level
+
+
+class I2S(object):
+    DEVICE_0, DEVICE_1, DEVICE_2 = range(3)
+    CHANNEL_0, CHANNEL_1, CHANNEL_2, CHANNEL_3 = range(4)
+    TRANSMITTER = 1
+    RECEIVER = 2
+    RESOLUTION_16_BIT = 2
+    STANDARD_MODE = 1
+
+    def __init__(self, device_num):
+        self.device_num = device_num
+
+    def channel_config(self, channel, mode, resolution=None, align_mode=None, cycles=None):
+        pass
+
+    def set_sample_rate(self, sample_rate):
+        self.sample_rate = sample_rate
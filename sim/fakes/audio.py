@@ -0,0 +1,37 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fake of MaixPy's audio module. Playback completes immediately.
+
+from sim.runtime import host_path, state
+
+
+class Audio(object):
+    def __init__(self, path=None, points=1024):
+        with open(host_path(path), "rb"):
+            pass
+        self.path = path
+
+    def volume(self, value=None):
+        return 20
+
+    def play_process(self, i2s_dev):
+        return (1, 44100, 16)
+
+    def play(self):
+        state.count("audio.play")
+        return 0
+
+    def finish(self):
+        pass
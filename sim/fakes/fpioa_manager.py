@@ -0,0 +1,53 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fake of MaixPy's fpioa_manager. Pin assignments are only recorded.
+
+
+class _Functions(object):
+    GPIO0, GPIO1, GPIO2, GPIO3, GPIO4, GPIO5, GPIO6, GPIO7 = range(56, 64)
+    GPIOHS0 = 24
+    UART1_TX, UART1_RX = 18, 19
+    UART2_TX, UART2_RX = 20, 21
+    UART3_TX, UART3_RX = 22, 23
+    I2S0_OUT_D1, I2S0_SCLK, I2S0_WS = 83, 88, 89
+
+
+class _FPIOA(object):
+    fpioa = _Functions
+
+    def __init__(self):
+        self.pins = {}
+
+    def register(self, pin, function, force=False):
+        self.pins[pin] = function
+
+    def unregister(self, pin):
+        self.pins.pop(pin, None)
+
+
+class _BoardInfo(object):
+    # M5StickV
+    BUTTON_A = 36
+    BUTTON_B = 37
+    SPK_SD = 25
+    SPK_DIN = 11
+    SPK_BCLK = 10
+    SPK_LRCLK = 12
+    CONNEXT_A = 35
+    CONNEXT_B = 34
+
+
+fm = _FPIOA()
+board_info = _BoardInfo()
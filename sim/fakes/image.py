@@ -0,0 +1,109 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fake of MaixPy's image module. Pixels are not simulated: an image is identified by a
+# seed (the scene it shows) and a frame number (sensor noise, 0 for stored images).
+# Images saved by the fake are tiny "SIMIMG" files so that a photo taken in camera mode
+# yields the same feature as the scene it was taken from. A camera frame may show its object only
+# in object_roi (in frame coordinates); window is the part of the frame the image holds.
+
+import zlib
+
+from sim.runtime import host_path, read_sim_seed, state, write_sim_image
+
+
+def seed_of(path):
+    return read_sim_seed(host_path(path))
+
+
+class Histogram(object):
+    def __init__(self, bins):
+        self._bins = bins
+
+    def bins(self):
+        return list(self._bins)
+
+    def l_bins(self):
+        return list(self._bins)
+
+
+class Image(object):
+    def __init__(self, path=None, copy_to_fb=False, width=320, height=240, seed=0, frame=0):
+        if path is not None:
+            seed = seed_of(path)
+            width = height = 224
+            state.count("image.load")
+        self.seed = seed
+        self.frame = frame
+        self._width = width
+        self._height = height
+        self.object_roi = None
+        self.window = (0, 0, width, height)
+
+    def __repr__(self):
+        return "{\"w\":%d, \"h\":%d, \"type\"=\"rgb565\", \"seed\":%d, \"frame\":%d}" % (
+            self._width, self._height, self.seed, self.frame)
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def draw_rectangle(self, *args, **kwargs):
+        state.count("image.draw_rectangle")
+        return self
+
+    def draw_string(self, *args, **kwargs):
+        state.count("image.draw_string")
+        return self
+
+    def draw_image(self, img, x, y, **kwargs):
+        # only whole images drawn at (0, 0), which copies the frame
+        state.count("image.draw_image")
+        self.seed = img.seed
+        self.frame = img.frame
+        self.object_roi = img.object_roi
+        self.window = img.window
+        return self
+
+    def pix_to_ai(self):
+        pass
+
+    def copy(self, roi=None, copy_to_fb=False):
+        img = Image(width=self._width, height=self._height, seed=self.seed, frame=self.frame)
+        img.object_roi = self.object_roi
+        img.window = self.window
+        if roi is not None:
+            img._width, img._height = roi[2], roi[3]
+            img.window = (self.window[0] + roi[0], self.window[1] + roi[1], roi[2], roi[3])
+        return img
+
+    def resize(self, width, height):
+        # the same part of the frame, scaled
+        img = self.copy()
+        img._width, img._height = width, height
+        return img
+
+    def get_histogram(self, bins=8, roi=None):
+        h = zlib.crc32(("%d" % self.seed).encode())
+        values = []
+        for i in range(bins):
+            values.append(((h >> (i % 32)) & 0xFF) / 255.0)
+        total = sum(values) or 1.0
+        return Histogram([x / total for x in values])
+
+    def save(self, path, roi=None, quality=95):
+        write_sim_image(host_path(path), self.seed)
+        state.count("image.save")
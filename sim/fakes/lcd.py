@@ -0,0 +1,56 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fake of MaixPy's lcd module for the 240x135 panel of M5StickV.
+
+from sim.runtime import delay, state
+
+
+WHITE = 0xFFFF
+BLACK = 0x0000
+RED = 0xF800
+GREEN = 0x07E0
+BLUE = 0x001F
+
+_rotation = 0
+
+
+def init(*args, **kwargs):
+    pass
+
+
+def rotation(value):
+    global _rotation
+    _rotation = value
+
+
+def width():
+    return 240 if _rotation in (0, 2) else 135
+
+
+def height():
+    return 135 if _rotation in (0, 2) else 240
+
+
+def display(img, **kwargs):
+    state.count("lcd.display")
+    delay("display")
+
+
+def draw_string(x, y, message, color=WHITE, bg_color=BLACK):
+    state.count("lcd.draw_string")
+
+
+def clear(color=BLACK):
+    state.count("lcd.clear")
@@ -0,0 +1,183 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fake of MaixPy's machine module.
+# UART is an in-memory loopback: bytes written are handed to the hub registered for the
+# UART number in state.hubs (see sim/hub.py), and the hub feeds its replies back with feed().
+# Timer callbacks run on a background thread with the real period.
+
+import threading
+import traceback
+
+from sim.runtime import state
+
+
+class UART(object):
+    UART1 = 1
+    UART2 = 2
+    UART3 = 3
+
+    def __init__(self, uart_num, baudrate=115200, bits=8, parity=None, stop=1, timeout=1000,
+            read_buf_len=128):
+        self.uart_num = uart_num
+        self.baudrate = baudrate
+        self.read_buf_len = read_buf_len
+        self.rx = bytearray()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.hub = state.hubs.get(uart_num)
+        state.uarts.append(self)
+        if self.hub is not None:
+            self.hub.attach(self)
+
+    def write(self, data):
+        if self.closed:
+            return 0
+        data = bytes(data)
+        state.count("uart.writes")
+        state.count("uart.tx_bytes", len(data))
+        if self.hub is not None:
+            self.hub.receive(self, data)
+        return len(data)
+
+    def feed(self, data):
+        with self.lock:
+            self.rx.extend(data)
+            overflow = len(self.rx) - self.read_buf_len
+            if overflow > 0:
+                del self.rx[:overflow]
+
+    def any(self):
+        return len(self.rx)
+
+    def read(self, nbytes=None):
+        with self.lock:
+            if not self.rx:
+                return None
+            if nbytes is None or nbytes > len(self.rx):
+                nbytes = len(self.rx)
+            data = bytes(self.rx[:nbytes])
+            del self.rx[:nbytes]
+        return data
+
+    def readinto(self, buf, nbytes=None):
+        if nbytes is None:
+            nbytes = len(buf)
+        data = self.read(nbytes)
+        if data is None:
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def readchar(self):
+        with self.lock:
+            if not self.rx:
+                return -1
+            x = self.rx[0]
+            del self.rx[0]
+        return x
+
+    def deinit(self):
+        self.closed = True
+        if self.hub is not None:
+            self.hub.detach(self)
+        if self in state.uarts:
+            state.uarts.remove(self)
+
+
+class Timer(object):
+    TIMER0, TIMER1, TIMER2 = range(3)
+    CHANNEL0, CHANNEL1, CHANNEL2, CHANNEL3 = range(4)
+    MODE_ONE_SHOT = 0
+    MODE_PERIODIC = 1
+    MODE_PWM = 2
+    UNIT_S = 0
+    UNIT_MS = 1
+    UNIT_US = 2
+    UNIT_NS = 3
+
+    def __init__(self, timer, channel, mode=MODE_ONE_SHOT, period=1000, unit=UNIT_MS, callback=None,
+            arg=None, start=True, priority=1, div=0):
+        self.timer = timer
+        self.channel = channel
+        self.mode = mode
+        self._period = period
+        self.unit = unit
+        self.callback_func = callback
+        self.arg = arg
+        self._stop = threading.Event()
+        self._thread = None
+        state.timers.append(self)
+        if start:
+            self.start()
+
+    def _period_s(self):
+        return self._period / (1.0, 1e3, 1e6, 1e9)[self.unit]
+
+    def _run(self):
+        stop = self._stop
+        while not stop.wait(self._period_s()):
+            if self.callback_func is not None:
+                try:
+                    self.callback_func(self)
+                except Exception:
+                    traceback.print_exc()
+                    break
+            if self.mode != Timer.MODE_PERIODIC:
+                break
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def restart(self):
+        self.stop()
+        self.start()
+
+    def period(self, period=None):
+        if period is None:
+            return self._period
+        self._period = period
+
+    def callback(self, callback):
+        self.callback_func = callback
+
+    def deinit(self):
+        self.stop()
+        if self in state.timers:
+            state.timers.remove(self)
+
+
+class I2C(object):
+    I2C0, I2C1, I2C2 = range(3)
+    MODE_MASTER = 0
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def scan(self):
+        return []
+
+
+def reset():
+    raise SystemExit()
@@ -0,0 +1,121 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fake of MaixPy's sensor module.
+# snapshot() shows the scenes listed in state.scenes (a list of seeds, cycled, or a callable
+# taking the frame number); by default it cycles through the reference images on the SD card.
+# A scene (seed, (x, y, w, h)) shows the object only in that rectangle of the 320x240 frame, on an
+# empty background (seed 0). The frame is 320x240 after reset() and set_windowing() centers a window.
+# After state.max_frames snapshots KeyboardInterrupt is raised, which ends the loops in boot.py.
+# Like the device, every snapshot is written into the same frame buffer image.
+
+import image
+import uos
+
+from sim.runtime import delay, state
+
+
+RGB565 = 2
+GRAYSCALE = 1
+QQVGA = 4
+QVGA = 8
+VGA = 10
+
+_default_scenes = None
+_window = (224, 224)
+_frame_buffer = None
+
+
+def reset(*args, **kwargs):
+    global _window, _frame_buffer
+    _window = (320, 240)
+    _frame_buffer = None
+    state.count("sensor.reset")
+    delay("camera")
+
+
+def set_pixformat(pixformat):
+    pass
+
+
+def set_framesize(framesize):
+    pass
+
+
+def set_windowing(roi):
+    global _window
+    _window = tuple(roi[-2:])
+
+
+def set_hmirror(enable):
+    pass
+
+
+def set_vflip(enable):
+    pass
+
+
+def run(enable):
+    pass
+
+
+def skip_frames(n=10, time=None):
+    pass
+
+
+def _reference_scenes():
+    global _default_scenes
+    if _default_scenes is None:
+        _default_scenes = []
+        try:
+            files = uos.listdir("/sd/images")
+        except OSError:
+            files = []
+        names = [x for x in files if x.endswith(".jpg") and x[:-4].isdigit()]
+        for name in sorted(names, key=lambda x: int(x[:-4])):
+            _default_scenes.append(image.seed_of("/sd/images/" + name))
+        if not _default_scenes:
+            _default_scenes.append(0)
+    return _default_scenes
+
+
+def snapshot():
+    global _frame_buffer
+    if state.max_frames is not None and state.frames >= state.max_frames:
+        raise KeyboardInterrupt()
+
+    state.frames += 1
+    frame = state.frames
+    scenes = state.scenes
+    if scenes is None:
+        scenes = _reference_scenes()
+    if callable(scenes):
+        seed = scenes(frame)
+    else:
+        seed = scenes[(frame - 1) % len(scenes)]
+    object_roi = None
+    if isinstance(seed, tuple):
+        seed, object_roi = seed
+
+    state.count("sensor.snapshot")
+    delay("snapshot")
+    width, height = _window
+    img = _frame_buffer
+    if img is None or img.width() != width or img.height() != height:
+        img = _frame_buffer = image.Image(width=width, height=height)
+    img.seed = seed
+    img.frame = frame
+    img.object_roi = object_roi
+    img.window = ((320 - width) // 2, (240 - height) // 2, width, height)
+    return img
@@ -0,0 +1,47 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fake of MaixPy's uos: paths under /sd are mapped to the simulated SD card directory.
+
+import os
+
+from sim.runtime import host_path, state
+
+
+def listdir(path="/"):
+    if path == "/":
+        return ["flash", "sd"] if state.sd_root is not None else ["flash"]
+    return os.listdir(host_path(path))
+
+
+def mkdir(path):
+    os.mkdir(host_path(path))
+
+
+def remove(path):
+    os.remove(host_path(path))
+
+
+def rename(old_path, new_path):
+    os.rename(host_path(old_path), host_path(new_path))
+
+
+def stat(path):
+    st = os.stat(host_path(path))
+    return (st.st_mode, st.st_ino, st.st_dev, st.st_nlink, st.st_uid, st.st_gid,
+        st.st_size, int(st.st_atime), int(st.st_mtime), int(st.st_ctime))
+
+
+def getcwd():
+    return "/sd"
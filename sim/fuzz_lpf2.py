@@ -0,0 +1,154 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Fuzzes LPF2_protocol.MessageParser with random hub message streams split into random
+# fragments, as uart.read() would return them.
+#
+#   python -m sim.fuzz_lpf2 --iterations 2000
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from LPF2_protocol import MessageParser, CMD_EXT_MODE, CMD_SELECT, CMD_WRITE, MESSAGE_CMD, MESSAGE_DATA, \
+    SYS_NACK, SYS_SYNC, message
+
+
+class ChunkedUART(object):
+    # delivers the stream in the given fragments, one fragment per read_from() call
+    def __init__(self, data, chunks):
+        self.data = data
+        self.chunks = chunks
+        self.pos = 0
+        self.available = 0
+
+    def arrive(self):
+        if self.chunks:
+            self.available += self.chunks.pop(0)
+
+    def any(self):
+        return self.available
+
+    def readinto(self, buf, nbytes):
+        n = min(nbytes, self.available)
+        buf[:n] = self.data[self.pos:self.pos + n]
+        self.pos += n
+        self.available -= n
+        return n
+
+
+def random_message(r):
+    kind = r.randrange(5)
+    if kind == 0:
+        return bytes([r.choice([SYS_SYNC, SYS_NACK])]), None
+    if kind == 1:
+        mode = r.randrange(10)
+        msg = bytes(message(MESSAGE_CMD, CMD_SELECT, bytes([mode])))
+        return msg, (msg[0], msg[1:-1])
+    if kind == 2:
+        msg = bytes(message(MESSAGE_CMD, CMD_WRITE, bytes([r.randrange(256), r.randrange(256)])))
+        return msg, (msg[0], msg[1:-1])
+    if kind == 3:
+        ext = bytes(message(MESSAGE_CMD, CMD_EXT_MODE, bytes([r.choice([0, 8])])))
+        data = bytes(message(MESSAGE_DATA, r.randrange(8),
+            bytes(r.randrange(256) for _ in range(r.choice([1, 2, 4, 8, 16, 32])))))
+        return ext + data, None
+    size = r.choice([1, 2, 4, 8])
+    msg = bytes(message(MESSAGE_DATA, r.randrange(8), bytes(r.randrange(256) for _ in range(size))))
+    return msg, (msg[0], msg[1:-1])
+
+
+def fragments(r, total):
+    chunks = []
+    while total > 0:
+        n = min(total, r.choice([1, 1, 2, 3, 5, 8, 13, 40]))
+        chunks.append(n)
+        total -= n
+    return chunks
+
+
+def parse_all(parser, uart):
+    headers = []
+    messages = []
+    while True:
+        uart.arrive()
+        while True:
+            received = parser.read_from(uart)
+            header = parser.next()
+            if header < 0:
+                if not received:
+                    break
+                continue
+            headers.append(header)
+            is_ext_mode = header & 0xC0 == MESSAGE_CMD and header & 0x07 == CMD_EXT_MODE
+            if header & 0xC0 != 0 and not is_ext_mode:
+                messages.append((header, bytes(parser.payload[:parser.payload_size])))
+        if not uart.chunks and uart.available == 0:
+            break
+    return headers, messages
+
+
+def fuzz_clean(r):
+    stream = bytearray()
+    expected = []
+    for _ in range(r.randrange(1, 40)):
+        msg, expect = random_message(r)
+        stream.extend(msg)
+        if msg[0] & 0xC0 == MESSAGE_CMD and msg[0] & 0x07 == CMD_EXT_MODE:
+            data = msg[3:]
+            expected.append((data[0], data[1:-1]))
+        elif expect is not None:
+            expected.append(expect)
+    parser = MessageParser()
+    _, messages = parse_all(parser, ChunkedUART(bytes(stream), fragments(r, len(stream))))
+    assert messages == expected, (messages, expected)
+    assert parser.checksum_errors == 0
+
+
+def fuzz_corrupt(r):
+    stream = bytearray()
+    for _ in range(r.randrange(1, 40)):
+        msg, _ = random_message(r)
+        stream.extend(msg)
+        if r.random() < 0.3:
+            stream.extend(bytes(r.randrange(256) for _ in range(r.randrange(1, 6))))
+    for _ in range(r.randrange(0, 4)):
+        if stream:
+            stream[r.randrange(len(stream))] = r.randrange(256)
+    parser = MessageParser()
+    uart = ChunkedUART(bytes(stream), fragments(r, len(stream)))
+    parse_all(parser, uart)
+    # everything was consumed, and what is left is at most one incomplete message
+    assert uart.pos == len(stream)
+    assert parser.count < 36
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzz the LPF2 RX parser with random fragmentation")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    r = random.Random(args.seed)
+    for _ in range(args.iterations):
+        fuzz_clean(r)
+        fuzz_corrupt(r)
+    print("ok: %d clean and %d corrupted streams" % (args.iterations, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
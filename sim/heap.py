@@ -0,0 +1,139 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Heap used by the reference vectors, measured with tracemalloc on the host.
+#
+#   python -m sim.heap --classes 10 100 200
+#   python -m sim.heap --classes 200 --cold
+#
+# "tuples" is the former layout (a list of (norm, bytearray, class) tuples next to the matcher's
+# int8 matrix and Python lists of norms and classes), "store" is ClassStore. "numpy" is the
+# matcher with numpy (ulab on the device) after scoring a query against all rows: the heap it still
+# holds and its peak during the query, which include whatever the dot products keep or widen
+# (needs numpy on the host). "boot" runs the
+# startup of boot.py with a warm feature cache (--cold: extracting every feature) and reports the
+# peak and the heap still held once the recognition loop runs, and "live" the high-water mark of
+# the heap after a collection seen by its HeapMonitor. Host sizes of Python objects are larger
+# than on MicroPython, but the vector payload is the same, so the ratios are what matters.
+
+import argparse
+import random
+import shutil
+import tempfile
+import tracemalloc
+from array import array
+
+import sim
+from sim.runtime import FEATURE_DIM
+
+from matcher import FeatureMatcher, np
+from quantizer import Quantizer
+
+
+HEAP_SIZE = 64 * 1024 * 1024  # host bytes seen as the heap by gc.mem_free() in the simulation
+
+
+def make_vectors(classes, seed=1):
+    r = random.Random(seed)
+    quantizer = Quantizer()
+    vectors = []
+    for class_num in range(1, classes + 1):
+        l, qvec = quantizer.quantize([r.gauss(0.0, 1.0) for _ in range(FEATURE_DIM)])
+        vectors.append((l, bytes(qvec), class_num))
+    return vectors
+
+
+def measure(build):
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        result = build()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current - base, peak - base
+
+
+def build_tuples(vectors):
+    feature_list = [(l, bytearray(qvec), class_num) for l, qvec, class_num in vectors]
+    matrix = array("b")
+    norms = []
+    class_nums = []
+    for l, qvec, class_num in feature_list:
+        for x in qvec:
+            matrix.append(x - 127)
+        norms.append(l)
+        class_nums.append(class_num)
+    return feature_list, matrix, norms, class_nums
+
+
+def build_store(vectors, use_numpy=False):
+    matcher = FeatureMatcher(use_numpy=use_numpy, capacity=len(vectors))
+    for l, qvec, class_num in vectors:
+        matcher.add(l, qvec, class_num)
+    return matcher
+
+
+def build_queried(vectors):
+    matcher = build_store(vectors, True)
+    matcher.dot_products(vectors[0][1])
+    return matcher
+
+
+def measure_boot(classes, cold=False, heap_size=HEAP_SIZE):
+    sd_root = sim.make_sd_card(tempfile.mkdtemp(prefix="cheese-heap-"), classes=classes)
+    try:
+        config = {"MAX_CLASS": classes}
+        if not cold:
+            # the first run extracts the features and writes the cache
+            sim.run_boot(sd_root, frames=1, config=config, buttons={"A": 0})
+        tracemalloc.start()
+        try:
+            result = sim.run_boot(sd_root, frames=1, config=config, buttons={"A": 0}, heap_size=heap_size)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        live = result.globals["heap"].peak_live
+        del result
+        return current, peak, live
+    finally:
+        shutil.rmtree(sd_root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Heap used by the reference vectors")
+    parser.add_argument("--classes", type=int, nargs="+", default=[10, 100, 200])
+    parser.add_argument("--no-boot", action="store_true", help="skip the boot.py measurement")
+    parser.add_argument("--cold", action="store_true", help="measure boot.py extracting the features")
+    args = parser.parse_args()
+
+    print("%8s %12s %12s %12s %12s %12s %12s %12s" % ("classes", "tuples", "store", "numpy held", "numpy peak",
+        "boot held", "boot peak", "boot live"))
+    for classes in args.classes:
+        vectors = make_vectors(classes)
+        tuples, _ = measure(lambda: build_tuples(vectors))
+        store, _ = measure(lambda: build_store(vectors))
+        np_held = np_peak = "-"
+        if np is not None:
+            np_held, np_peak = measure(lambda: build_queried(vectors))
+        held = peak = live = 0
+        if not args.no_boot:
+            held, peak, live = measure_boot(classes, args.cold)
+        print("%8d %12d %12d %12s %12s %12d %12d %12d" % (classes, tuples, store, np_held, np_peak, held, peak,
+            live))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Scripted LEGO hub (SPIKE Prime / MINDSTORMS Robot Inventor) on the other end of a fake UART.
+# It parses the LPF2 stream written by the device, answers the handshake with ACK, then sends
+# NACK keep-alives and records the data messages it receives. play() scripts resets (hub power
+# cycle, cable replug) and periods in which handshakes are not answered.
+
+import threading
+import time
+
+from sim.runtime import real_sleep, ticks_us
+
+
+SYS_ACK = 0x04
+SYS_NACK = 0x02
+MESSAGE_SYS = 0x00
+MESSAGE_CMD = 0x40
+MESSAGE_INFO = 0x80
+MESSAGE_DATA = 0xC0
+CMD_SELECT = 0x03
+CMD_EXT_MODE = 0x06
+
+
+def checksum(data):
+    c = 0xFF
+    for x in data:
+        c ^= x
+    return c
+
+
+class FakeHub(object):
+    def __init__(self, nack_period_ms=100, respond=True):
+        self.nack_period_ms = nack_period_ms
+        self.respond = respond
+        self.uart = None
+        self.connected = False
+        self.buffer = bytearray()
+        self.ext_mode = 0
+        self.info_messages = 0
+        self.checksum_errors = 0
+        self.handshake_bytes = 0
+        self.commands = []
+        self.data_frames = []
+        self.nacks_sent = 0
+        self.connects = 0
+        self.events = []  # (ticks_us, action) of play()
+        self.lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def attach(self, uart):
+        with self.lock:
+            self.uart = uart
+            self.buffer = bytearray()
+
+    def detach(self, uart):
+        with self.lock:
+            if self.uart is uart:
+                self.uart = None
+
+    def send(self, data):
+        with self.lock:
+            if self.uart is not None:
+                self.uart.feed(data)
+
+    def select_mode(self, mode):
+        self.send(bytes([0x43, mode, checksum([0x43, mode])]))
+
+    def reset(self):
+        # hub power cycle or cable unplug: stop talking and wait for a new handshake
+        with self.lock:
+            self.connected = False
+            self.info_messages = 0
+            self.ext_mode = 0
+        self._stop_keepalive()
+
+    def stop(self):
+        self._stop_keepalive()
+
+    def play(self, script):
+        # script: [(ms from now, action), ...] with the actions "reset", "mute" (handshakes are not
+        # answered) and "unmute"; runs in a background thread
+        start = time.perf_counter()
+
+        def run():
+            for at_ms, action in sorted(script):
+                wait = start + at_ms / 1000.0 - time.perf_counter()
+                if wait > 0:
+                    real_sleep(wait)
+                if action == "reset":
+                    self.reset()
+                elif action == "mute":
+                    self.respond = False
+                elif action == "unmute":
+                    self.respond = True
+                else:
+                    raise ValueError("unknown action: %s" % (action,))
+                self.events.append((ticks_us(), action))
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def _stop_keepalive(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._thread = None
+
+    def _start_keepalive(self):
+        self._stop_keepalive()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._keepalive, daemon=True)
+        self._thread.start()
+
+    def _keepalive(self):
+        stop = self._stop
+        while not stop.wait(self.nack_period_ms / 1000.0):
+            with self.lock:
+                if self.connected and self.uart is not None:
+                    self.uart.feed(bytes([SYS_NACK]))
+                    self.nacks_sent += 1
+
+    def receive(self, uart, data):
+        now = ticks_us()
+        with self.lock:
+            if uart is not self.uart:
+                return
+            if not self.connected:
+                self.handshake_bytes += len(data)
+            buf = self.buffer
+            buf.extend(data)
+            while buf:
+                header = buf[0]
+                message_type = header & 0xC0
+                if message_type == MESSAGE_SYS:
+                    del buf[0]
+                    if header == SYS_ACK and not self.connected and self.info_messages > 0 and self.respond:
+                        self.connected = True
+                        self.connects += 1
+                        uart.feed(bytes([SYS_ACK]))
+                        self._start_keepalive()
+                    continue
+
+                size = 1 << ((header >> 3) & 0x07)
+                total = size + (3 if message_type == MESSAGE_INFO else 2)
+                if len(buf) < total:
+                    break
+
+                message = bytes(buf[:total])
+                if checksum(message[:-1]) != message[-1]:
+                    self.checksum_errors += 1
+                    del buf[0]
+                    continue
+                del buf[:total]
+
+                if message_type == MESSAGE_INFO:
+                    self.info_messages += 1
+                elif message_type == MESSAGE_CMD:
+                    if header & 0x07 == CMD_EXT_MODE:
+                        self.ext_mode = message[1]
+                    self.commands.append((now, message))
+                else:
+                    mode = (header & 0x07) + self.ext_mode
+                    self.data_frames.append((now, mode, message[1:-1]))
@@ -0,0 +1,92 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Measures the latency from set_data() (a new recognition result) to the moment the hub
+# receives it, with and without the low latency mode of the LPF2 device classes.
+#
+#   python -m sim.latency --device mindstorms --samples 20
+
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+import sim
+from sim.runtime import real_sleep, ticks_diff, ticks_us
+
+
+def decode(device, payload):
+    if device == "spike":
+        return payload[0]
+    return payload[0] | (payload[1] << 8)
+
+
+def measure(device, low_latency, samples, keepalive_period=200, nack_period_ms=100, seed=0):
+    sd_root = tempfile.mkdtemp(prefix="cheese-latency-")
+    hub = sim.FakeHub(nack_period_ms=nack_period_ms)
+    sim.install(sd_root, hubs={sim.HUB_UART: hub})
+    try:
+        if device == "spike":
+            from LPF2 import SpikePrimeDevice as device_class
+        else:
+            from LPF2_mindstorms import MindstromsDevice as device_class
+        dev = sim.connect_device(device_class, hub, keepalive_period=keepalive_period, low_latency=low_latency)
+        if not dev.connected:
+            raise RuntimeError("handshake failed")
+
+        r = random.Random(seed)
+        latencies = []
+        for i in range(samples):
+            # detections arrive at an arbitrary phase of the timer
+            real_sleep(r.uniform(0.0, keepalive_period / 1000.0))
+            value = (i % 20 + 1) * 10
+            start_frames = len(hub.data_frames)
+            t0 = ticks_us()
+            dev.set_data(value)
+            deadline = time.perf_counter() + 2.0
+            received = None
+            while received is None and time.perf_counter() < deadline:
+                for t, mode, payload in hub.data_frames[start_frames:]:
+                    if decode(device, payload) == value:
+                        received = t
+                        break
+                else:
+                    real_sleep(0.0005)
+            if received is None:
+                raise RuntimeError("value %d never reached the hub" % value)
+            latencies.append(ticks_diff(received, t0))
+        return latencies, dev.latency_us
+    finally:
+        sim.uninstall()
+        shutil.rmtree(sd_root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection-to-UART latency against the fake hub")
+    parser.add_argument("--device", choices=["spike", "mindstorms"], default="mindstorms")
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--keepalive-period", type=int, default=200)
+    args = parser.parse_args()
+
+    for low_latency in (False, True):
+        latencies, _ = measure(args.device, low_latency, args.samples, args.keepalive_period)
+        latencies.sort()
+        print("low_latency=%s: p50 %0.1f ms, p95 %0.1f ms, max %0.1f ms" % (low_latency,
+            latencies[len(latencies) // 2] / 1000.0, latencies[int(0.95 * (len(latencies) - 1))] / 1000.0,
+            latencies[-1] / 1000.0))
+
+
+if __name__ == "__main__":
+    main()
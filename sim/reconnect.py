@@ -0,0 +1,136 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Recovery of the LPF2 link (LPF2_connection.ConnectionManager) from hub resets, against the
+# scripted fake hub, while a loop keeps setting results like the recognition loop does.
+#
+#   python -m sim.reconnect
+#   python -m sim.reconnect --device spike --script 500:reset,2500:mute,2600:reset,6000:unmute
+#   python -m sim.reconnect --diagnostics
+#
+# Prints the outages seen by the hub, the counters of the manager and the device, the link
+# statistics (link_stats.LinkStats) and the longest gap between two iterations of the loop (the
+# handshakes must not stall it). With --diagnostics the hub selects the diagnostic mode after each
+# handshake and the last values it read are printed. Fails when the hub is not connected again at
+# the end.
+
+import argparse
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+import sim
+from sim.runtime import real_sleep
+
+
+def parse_script(text):
+    script = []
+    for item in text.split(","):
+        if item:
+            at_ms, action = item.split(":")
+            script.append((float(at_ms), action.strip()))
+    return script
+
+
+def run(device, script, duration_ms, frame_ms, timeout, max_backoff, diagnostics=False):
+    sd_root = tempfile.mkdtemp(prefix="cheese-reconnect-")
+    hub = sim.FakeHub()
+    sim.install(sd_root, hubs={sim.HUB_UART: hub}, time_scale=1.0)
+    try:
+        if device == "spike":
+            from LPF2 import SpikePrimeDevice as device_class
+        else:
+            from LPF2_mindstorms import MindstromsDevice as device_class
+        from LPF2_connection import ConnectionManager
+
+        dev = device_class(tx_pin=34, rx_pin=35, diagnostics=diagnostics)
+        link = ConnectionManager(dev, timeout, max_backoff=max_backoff)
+        link.start()
+
+        start = time.perf_counter()
+        hub.play(script)
+        outages = []
+        down_since = None
+        max_gap = 0.0
+        last = time.perf_counter()
+        frame = 0
+        while time.perf_counter() - start < duration_ms / 1000.0:
+            frame += 1
+            class_num = frame // 20 % 10 + 1
+            dev.set_data(class_num * 10)
+            dev.set_result(class_num, 0.1, 0, frame)
+
+            now = time.perf_counter()
+            max_gap = max(max_gap, now - last)
+            last = now
+            if diagnostics and hub.connected and hub.data_frames and hub.data_frames[-1][1] != len(dev.modes) - 1:
+                # the hub selects the mode until the device sends it
+                hub.select_mode(len(dev.modes) - 1)
+            if not hub.connected and down_since is None:
+                down_since = now
+            elif hub.connected and down_since is not None:
+                outages.append(((down_since - start) * 1000, (now - down_since) * 1000))
+                down_since = None
+            real_sleep(frame_ms / 1000.0)
+
+        link.stop()
+        # while the fake time module is installed
+        dev.stats.report()
+        return hub, link, dev, outages, down_since, max_gap, frame
+    finally:
+        sim.uninstall()
+        shutil.rmtree(sd_root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recovery of the LPF2 link from hub resets")
+    parser.add_argument("--device", choices=["spike", "mindstorms"], default="mindstorms")
+    parser.add_argument("--script", default="1000:reset,3000:mute,3100:reset,7000:unmute",
+        help="hub events as ms:action, actions: reset, mute, unmute")
+    parser.add_argument("--duration", type=float, default=10000.0, help="ms")
+    parser.add_argument("--frame", type=float, default=20.0, help="ms per loop iteration")
+    parser.add_argument("--timeout", type=int, default=1000, help="LPF2_TIMEOUT (ms)")
+    parser.add_argument("--max-backoff", type=int, default=5000, help="LPF2_RETRY_MAX (ms)")
+    parser.add_argument("--diagnostics", action="store_true", help="read the diagnostic mode (LPF2_DIAGNOSTICS)")
+    args = parser.parse_args()
+
+    hub, link, dev, outages, down_since, max_gap, frames = run(args.device, parse_script(args.script),
+        args.duration, args.frame, args.timeout, args.max_backoff, args.diagnostics)
+
+    print("outages seen by the hub:")
+    for at, length in outages:
+        print("  at %6d ms: %6d ms" % (at, length))
+    if down_since is not None:
+        print("  not connected at the end")
+    print("handshakes %d, connects %d, reconnects %d, lost %d, timeouts %d" % (link.attempts, link.connects,
+        link.reconnects, link.lost, link.timeouts))
+    print("frames %d, dropped %d, NACKs received %d, hub data messages %d" % (frames, dev.dropped_frames,
+        dev.nacks, len(hub.data_frames)))
+    print("longest loop iteration: %0.1f ms (frame period %0.1f ms)" % (max_gap * 1000, args.frame))
+    if args.diagnostics:
+        diagnostic = [x for x in hub.data_frames if x[1] == len(dev.modes) - 1]
+        if diagnostic:
+            print("diagnostic mode, last of %d reads: frames %d, %d bytes/s, NACKs %d, NACK interval p95 %d ms, "
+                "checksum errors %d, mode switches %d, latency p50 %d us, p95 %d us" % ((len(diagnostic),) +
+                struct.unpack("<8i", diagnostic[-1][2])))
+        else:
+            print("diagnostic mode: not read")
+    if down_since is not None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
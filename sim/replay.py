@@ -0,0 +1,175 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Replays a session recorded by the device (SESSION_LOG_DIR, see session_log.py) through the
+# matching of boot.py: the index, the per-class thresholds and the decision filter are built from
+# the feature cache of the SD card as on the device, and fed the recorded vectors.
+#
+#   python -m sim.replay /path/to/sd/logs/session_1.bin --features /path/to/sd/features.bin
+#   python -m sim.replay session_1.bin --features features.bin --threshold 0.2 0.25 0.3 --expect 3
+#   python -m sim.replay session_1.bin --features features.bin --quantization int4 --rerank 20 --diff
+#
+# Settings not given on the command line are the ones the session was recorded with, so a replay
+# without options reproduces the recorded decisions (unless CLASS_THRESHOLDS was set on the device,
+# pass it with --class-thresholds, or the prototypes changed since). For each ENTER_THRESHOLD
+# given, prints the frames decided as a class, the decisions that differ from the recorded ones,
+# the number of times the decision changed (flicker) and, with --expect, the frames decided as
+# another class than the one the camera was showing.
+
+import argparse
+import math
+import sys
+import time
+
+from class_thresholds import ClassThresholds
+from feature_cache import read_entries
+from matcher import QUANT_INT8, ClassIndex, FeatureMatcher, pack_matcher
+from session_log import QUANTIZATIONS, read_session
+from smoothing import DecisionFilter
+
+
+def build(entries, settings, max_class, class_thresholds):
+    # the index and the decision filter of boot.py for these settings
+    matcher = FeatureMatcher(capacity=len(entries))
+    for image_path, class_num, sq, qvec in entries:
+        matcher.add(math.sqrt(sq), qvec, class_num)
+
+    enter = settings["ENTER_THRESHOLD"]
+    exit = settings["EXIT_THRESHOLD"]
+    quantization = settings["QUANTIZATION"]
+    adaptive = settings["ADAPTIVE_THRESHOLDS"]
+    thresholds = ClassThresholds(max_class, enter, settings["MIN_CLASS_THRESHOLD"], exit - enter, class_thresholds)
+    class_index = None
+    if quantization == QUANT_INT8 or adaptive:
+        class_index = ClassIndex(matcher)
+    if adaptive and matcher.count > 0:
+        thresholds.compute(class_index)
+    if quantization == QUANT_INT8:
+        index = class_index
+    else:
+        index = pack_matcher(matcher, quantization, settings["RERANK"])
+
+    decision = DecisionFilter(settings["SMOOTHING_WINDOW"], settings["SMOOTHING_VOTES"],
+        settings["SMOOTHING_ALPHA"], enter, exit)
+    if adaptive or class_thresholds:
+        index.class_thresholds = thresholds.limits
+        decision.class_thresholds = thresholds.values
+    return index, decision
+
+
+def replay(records, index, decision, search_threshold):
+    # [(nearest, decided)] per record
+    results = []
+    for record in records:
+        sq, qvec = record[2], record[9]
+        nearest, nearest_dist, runner_up, runner_up_dist = index.nearest(math.sqrt(sq), qvec, search_threshold)
+        decided, _ = decision.update(nearest, nearest_dist, runner_up, runner_up_dist)
+        results.append((nearest, decided))
+    return results
+
+
+def changes(decisions):
+    return sum([1 for i in range(1, len(decisions)) if decisions[i] != decisions[i - 1]])
+
+
+def parse_class_thresholds(text):
+    thresholds = {}
+    for item in text.split(","):
+        if item:
+            class_num, value = item.split(":")
+            thresholds[int(class_num)] = float(value)
+    return thresholds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded session through the matching of boot.py")
+    parser.add_argument("log", help="session_N.bin recorded with SESSION_LOG_DIR")
+    parser.add_argument("--features", required=True, help="features.bin of the SD card")
+    parser.add_argument("--threshold", type=float, nargs="+", help="ENTER_THRESHOLD(s) to evaluate")
+    parser.add_argument("--exit-margin", type=float, help="EXIT_THRESHOLD - ENTER_THRESHOLD")
+    parser.add_argument("--search-threshold", type=float, help="SEARCH_THRESHOLD")
+    parser.add_argument("--window", type=int, help="SMOOTHING_WINDOW")
+    parser.add_argument("--votes", type=int, help="SMOOTHING_VOTES")
+    parser.add_argument("--alpha", type=float, help="SMOOTHING_ALPHA")
+    parser.add_argument("--adaptive", choices=["on", "off"], help="ADAPTIVE_THRESHOLDS")
+    parser.add_argument("--min-threshold", type=float, help="MIN_CLASS_THRESHOLD")
+    parser.add_argument("--class-thresholds", default="", help="CLASS_THRESHOLDS as class:threshold,...")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, help="QUANTIZATION")
+    parser.add_argument("--rerank", type=int, help="RERANK")
+    parser.add_argument("--expect", type=int, help="class shown to the camera during the session (0: none)")
+    parser.add_argument("--diff", action="store_true", help="list the frames decided differently than recorded")
+    args = parser.parse_args()
+
+    recorded, records = read_session(args.log)
+    dim, entries = read_entries(args.features)
+    if records and len(records[0][9]) != dim:
+        sys.exit("the session has %d dimensions, the feature cache %d" % (len(records[0][9]), dim))
+    entries.sort(key=lambda x: (x[1], x[0]))
+
+    settings = dict(recorded)
+    for name, value in (("SEARCH_THRESHOLD", args.search_threshold), ("SMOOTHING_WINDOW", args.window),
+            ("SMOOTHING_VOTES", args.votes), ("SMOOTHING_ALPHA", args.alpha),
+            ("MIN_CLASS_THRESHOLD", args.min_threshold), ("QUANTIZATION", args.quantization),
+            ("RERANK", args.rerank)):
+        if value is not None:
+            settings[name] = value
+    if args.adaptive is not None:
+        settings["ADAPTIVE_THRESHOLDS"] = args.adaptive == "on"
+    margin = recorded["EXIT_THRESHOLD"] - recorded["ENTER_THRESHOLD"]
+    if args.exit_margin is not None:
+        margin = args.exit_margin
+    class_thresholds = parse_class_thresholds(args.class_thresholds)
+    max_class = max([x[1] for x in entries] + [max(x[3], x[5]) for x in records] + [1])
+
+    seconds = 0.0
+    if len(records) > 1:
+        seconds = ((records[-1][0] - records[0][0]) & 0xFFFFFFFF) / 1000.0
+    print("%d frames over %0.1f s, %d prototypes of %d classes" % (len(records), seconds, len(entries),
+        len(set([x[1] for x in entries]))))
+    print("recorded with: " + ", ".join(["%s=%s" % (name, recorded[name]) for name in sorted(recorded)]))
+    logged = [x[5] for x in records]
+    print("recorded decisions: %d frames decided, %d changes" % (len([1 for x in logged if x > 0]),
+        changes(logged)))
+
+    print("\n%9s %9s %9s %9s %9s %9s %10s" % ("threshold", "decided", "wrong", "changes", "nearest", "decision",
+        "frames/s"))
+    for enter in args.threshold or [recorded["ENTER_THRESHOLD"]]:
+        settings["ENTER_THRESHOLD"] = enter
+        settings["EXIT_THRESHOLD"] = enter + margin
+        index, decision = build(entries, settings, max_class, class_thresholds)
+        start = time.perf_counter()
+        results = replay(records, index, decision, settings["SEARCH_THRESHOLD"])
+        elapsed = time.perf_counter() - start
+
+        decisions = [x[1] for x in results]
+        decided = len([1 for x in decisions if x > 0])
+        wrong = "-"
+        if args.expect is not None:
+            wrong = "%d" % len([1 for x in decisions if x > 0 and x != args.expect])
+        # agreement with the recorded nearest classes and decisions
+        same_nearest = len([1 for x, r in zip(results, records) if x[0] == r[3]])
+        same_decision = len([1 for x, r in zip(decisions, records) if x == r[5]])
+        print("%9.3f %9d %9s %9d %8.1f%% %8.1f%% %10d" % (enter, decided, wrong, changes(decisions),
+            100.0 * same_nearest / max(len(records), 1), 100.0 * same_decision / max(len(records), 1),
+            len(records) / elapsed if elapsed > 0 else 0))
+
+        if args.diff:
+            for (nearest, decided_class), record in zip(results, records):
+                if decided_class != record[5]:
+                    print("  frame %6d: recorded %3d (nearest %3d, %0.3f), replayed %3d (nearest %3d)" % (
+                        record[1], record[5], record[3], record[6], decided_class, nearest))
+
+
+if __name__ == "__main__":
+    main()
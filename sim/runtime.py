@@ -0,0 +1,252 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Shared state of the fake MaixPy modules in sim/fakes.
+
+import _thread
+import builtins
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import types
+import zlib
+
+
+FAKES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fakes")
+FAKE_MODULES = ("KPU", "Maix", "audio", "fpioa_manager", "image", "lcd", "machine", "sensor", "uos", "config")
+SD_PREFIX = "/sd"
+
+FEATURE_DIM = 768
+
+# images written by the simulation only hold the seed of the scene they show
+SIM_IMAGE_MAGIC = b"SIMIMG"
+
+
+class SimState(object):
+    def __init__(self):
+        self.sd_root = None
+        self.time_scale = 0.0
+        self.max_frames = None
+        self.frames = 0
+        self.scenes = None
+        self.noise = 0.2
+        self.recording = None
+        self.recording_index = 0
+        self.gpio_inputs = {}
+        self.hubs = {}
+        self.timers = []
+        self.uarts = []
+        self.counters = {}
+        self.delays = {}
+        self.kpu_async = False
+        self.threads = []
+        self.heap_size = None
+        self.lock = threading.RLock()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+
+state = SimState()
+
+_saved = {}
+
+
+def host_path(path):
+    if state.sd_root is not None and (path == SD_PREFIX or path.startswith(SD_PREFIX + "/")):
+        return state.sd_root + path[len(SD_PREFIX):]
+    return path
+
+
+def delay(stage):
+    # simulated duration of a device operation (camera, load, snapshot, forward, display) in real seconds
+    seconds = state.delays.get(stage)
+    if seconds:
+        real_sleep(seconds)
+
+
+def write_sim_image(path, seed):
+    with _saved.get("open", builtins.open)(path, "wb") as f:
+        f.write(SIM_IMAGE_MAGIC + str(seed).encode())
+
+
+def read_sim_seed(path):
+    with _saved.get("open", builtins.open)(path, "rb") as f:
+        data = f.read()
+    if data.startswith(SIM_IMAGE_MAGIC):
+        return int(data[len(SIM_IMAGE_MAGIC):].decode())
+    return zlib.crc32(data)
+
+
+def _open(file, *args, **kwargs):
+    if isinstance(file, str):
+        file = host_path(file)
+    return _saved["open"](file, *args, **kwargs)
+
+
+def sleep(seconds):
+    if state.time_scale > 0:
+        real_sleep(seconds * state.time_scale)
+
+
+def sleep_ms(ms):
+    sleep(ms / 1000.0)
+
+
+def sleep_us(us):
+    sleep(us / 1000000.0)
+
+
+def ticks_ms():
+    return int(time.perf_counter() * 1000) & 0x3FFFFFFF
+
+
+def ticks_us():
+    return int(time.perf_counter() * 1000000) & 0x3FFFFFFF
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & 0x3FFFFFFF
+
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) & 0x3FFFFFFF
+    if diff >= 0x20000000:
+        diff -= 0x40000000
+    return diff
+
+
+def start_new_thread(function, args, kwargs=None):
+    # _thread.start_new_thread of the simulated script; uninstall() waits for these threads
+    thread = threading.Thread(target=function, args=args, kwargs=kwargs or {}, daemon=True)
+    with state.lock:
+        state.threads.append(thread)
+    thread.start()
+    return thread.ident
+
+
+def mem_alloc():
+    # gc.mem_alloc / gc.mem_free of MicroPython, from the host allocations traced since install();
+    # host objects are larger than on the device, so heap_size is in host bytes
+    return tracemalloc.get_traced_memory()[0]
+
+
+def mem_free():
+    return max(0, state.heap_size - mem_alloc())
+
+
+real_sleep = time.sleep
+
+_TIME_PATCHES = {
+    "sleep": sleep,
+    "sleep_ms": sleep_ms,
+    "sleep_us": sleep_us,
+    "ticks_ms": ticks_ms,
+    "ticks_us": ticks_us,
+    "ticks_add": ticks_add,
+    "ticks_diff": ticks_diff,
+}
+
+
+def install(sd_root, time_scale=0.0, max_frames=None, scenes=None, noise=0.2, recording=None,
+        gpio_inputs=None, hubs=None, config=None, delays=None, kpu_async=False, heap_size=None):
+    uninstall()
+
+    state.__init__()
+    state.sd_root = os.path.abspath(sd_root)
+    state.time_scale = time_scale
+    state.max_frames = max_frames
+    state.scenes = scenes
+    state.noise = noise
+    state.recording = recording
+    state.gpio_inputs = dict(gpio_inputs or {})
+    state.hubs = dict(hubs or {})
+    state.delays = dict(delays or {})
+    state.kpu_async = kpu_async
+    state.heap_size = heap_size
+
+    _saved["open"] = builtins.open
+    builtins.open = _open
+    _saved["_thread.start_new_thread"] = _thread.start_new_thread
+    _thread.start_new_thread = start_new_thread
+    if heap_size is not None:
+        _saved["tracemalloc"] = not tracemalloc.is_tracing()
+        if _saved["tracemalloc"]:
+            tracemalloc.start()
+        gc.mem_alloc = mem_alloc
+        gc.mem_free = mem_free
+
+    for name, func in _TIME_PATCHES.items():
+        _saved["time." + name] = getattr(time, name, None)
+        setattr(time, name, func)
+
+    _saved["modules"] = set(sys.modules)
+    # like MaixPy, modules and config.py are also looked up on the SD card
+    _saved["paths"] = (FAKES_DIR, state.sd_root)
+    sys.path.insert(0, state.sd_root)
+    sys.path.insert(0, FAKES_DIR)
+    if config:
+        module = types.ModuleType("config")
+        for key, value in config.items():
+            setattr(module, key, value)
+        sys.modules["config"] = module
+
+    return state
+
+
+def uninstall():
+    # background threads of the script (hub handshake, enrollment) finish with the fakes in place
+    for thread in list(state.threads):
+        thread.join(5.0)
+    if "_thread.start_new_thread" in _saved:
+        _thread.start_new_thread = _saved.pop("_thread.start_new_thread")
+    if "tracemalloc" in _saved:
+        del gc.mem_alloc, gc.mem_free
+        if _saved.pop("tracemalloc"):
+            tracemalloc.stop()
+
+    for timer in list(state.timers):
+        timer.deinit()
+    for uart in list(state.uarts):
+        uart.deinit()
+    for hub in state.hubs.values():
+        hub.stop()
+
+    if "open" in _saved:
+        builtins.open = _saved.pop("open")
+
+    for name in _TIME_PATCHES:
+        key = "time." + name
+        if key in _saved:
+            func = _saved.pop(key)
+            if func is None:
+                delattr(time, name)
+            else:
+                setattr(time, name, func)
+
+    for path in _saved.pop("paths", ()):
+        if path in sys.path:
+            sys.path.remove(path)
+    for name in FAKE_MODULES:
+        sys.modules.pop(name, None)
+    # device modules imported during the simulation hold references to the fakes
+    if "modules" in _saved:
+        before = _saved.pop("modules")
+        for name in list(sys.modules):
+            if name not in before and not name.startswith("sim"):
+                sys.modules.pop(name, None)
@@ -0,0 +1,124 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Pairwise similarity of the reference images, computed on the host from the feature cache
+# of the SD card (this used to be printed by boot.py on every start).
+#
+#   python -m sim.similarity /path/to/sd/features.bin
+#   python -m sim.similarity features.bin --threshold 0.3 --csv matrix.csv
+#
+# Lists the class pairs whose nearest prototypes are closer than --margin (a frame could then be
+# within the threshold of both) and the per-class thresholds the device derives when
+# ADAPTIVE_THRESHOLDS is on (see class_thresholds.py), which can be pinned with CLASS_THRESHOLDS.
+
+import argparse
+import math
+
+from class_thresholds import ClassThresholds
+from feature_cache import read_entries
+from matcher import ClassIndex, FeatureMatcher, np
+
+
+def distance_matrix(matcher):
+    if matcher.use_numpy:
+        m = np.array(matcher._np_rows(0, matcher.count), dtype=np.float64)
+        norms = np.array(matcher.norms[:matcher.count], dtype=np.float64)
+        return (1 - np.dot(m, m.T) / np.outer(norms, norms)).tolist()
+
+    rows = []
+    for i in range(matcher.count):
+        l, qvec, _ = matcher.get(i)
+        rows.append(matcher.distances(l, qvec))
+    return rows
+
+
+def class_distances(matcher, dists):
+    # {(class a, class b): distance of their nearest prototypes}, a <= b
+    pairs = {}
+    class_nums = matcher.class_nums
+    for i in range(matcher.count):
+        for j in range(i + 1, matcher.count):
+            a, b = sorted((class_nums[i], class_nums[j]))
+            d = dists[i][j]
+            if (a, b) not in pairs or d < pairs[(a, b)]:
+                pairs[(a, b)] = d
+    return pairs
+
+
+def spreads(matcher, dists):
+    # {class: largest distance between two of its prototypes}
+    result = {}
+    class_nums = matcher.class_nums
+    for i in range(matcher.count):
+        result.setdefault(class_nums[i], 0.0)
+        for j in range(i + 1, matcher.count):
+            if class_nums[i] == class_nums[j]:
+                result[class_nums[i]] = max(result[class_nums[i]], dists[i][j])
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pairwise similarity of the reference images")
+    parser.add_argument("cache", help="features.bin of the SD card")
+    parser.add_argument("--threshold", type=float, default=0.3, help="SIMILARITY_THRESHOLD of the device")
+    parser.add_argument("--min-threshold", type=float, default=0.1, help="MIN_CLASS_THRESHOLD of the device")
+    parser.add_argument("--margin", type=float, help="flag pairs closer than this (default: 2 x threshold)")
+    parser.add_argument("--csv", help="write the full distance matrix of the images to this file")
+    args = parser.parse_args()
+    margin = args.margin if args.margin is not None else 2 * args.threshold
+
+    dim, entries = read_entries(args.cache)
+    entries.sort(key=lambda x: (x[1], x[0]))
+    matcher = FeatureMatcher(capacity=len(entries))
+    for image_path, class_num, sq, qvec in entries:
+        matcher.add(math.sqrt(sq), qvec, class_num)
+    print("%d images of %d classes, %d dimensions" % (matcher.count, len(set(x[1] for x in entries)), dim))
+
+    dists = distance_matrix(matcher)
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write("image,class," + ",".join(x[0] for x in entries) + "\n")
+            for (image_path, class_num, _, _), row in zip(entries, dists):
+                f.write("%s,%d," % (image_path, class_num) + ",".join("%0.4f" % d for d in row) + "\n")
+
+    pairs = class_distances(matcher, dists)
+    confusable = sorted((d, a, b) for (a, b), d in pairs.items() if a != b and d < margin)
+    print("\nclass pairs closer than %0.2f:" % margin)
+    for d, a, b in confusable:
+        print("  %3d - %3d  %0.3f" % (a, b, d))
+    if not confusable:
+        print("  none")
+
+    spread = spreads(matcher, dists)
+    adaptive = ClassThresholds(max(spread), args.threshold, args.min_threshold)
+    adaptive.compute(ClassIndex(matcher))
+    print("\n%5s %10s %8s %10s %10s %10s" % ("class", "nearest", "dist", "intra", "spread", "threshold"))
+    thresholds = {}
+    for c in sorted(spread):
+        others = [(d, b if a == c else a) for (a, b), d in pairs.items() if a != b and c in (a, b)]
+        if others:
+            d, nearest = min(others)
+        else:
+            d, nearest = 2.0, 0
+        thresholds[c] = round(adaptive.values[c], 3)
+        note = "  (prototypes farther apart than the threshold)" if spread[c] > 2 * thresholds[c] else ""
+        print("%5d %10d %8.3f %10.3f %10.3f %10.3f%s" % (c, nearest, d, adaptive.intra[c], spread[c],
+            thresholds[c], note))
+
+    print("\nper-class thresholds (derived by the device unless overridden in config.py):")
+    print("CLASS_THRESHOLDS = {%s}" % ", ".join("%d: %s" % (c, thresholds[c]) for c in sorted(thresholds)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+
+
+class DecisionFilter(object):
+    # Debounces the per-frame matches into a stable decision.
+    # Each frame votes for its nearest class if it is within enter_threshold, otherwise for 0.
+    # The last `window` votes are kept in a ring buffer; a class is entered when it has at least
+    # `votes` of them. The distance of the decided class is smoothed by an exponential moving
+    # average (alpha: weight of the newest frame) and the class is left when the average goes
+    # beyond exit_threshold. window=1, votes=1, alpha=1 and equal thresholds pass frames through.
+    # class_thresholds (an array indexed by class number, see ClassThresholds.values) optionally
+    # lowers the enter threshold of each class; its exit threshold keeps the same hysteresis.
+    def __init__(self, window=5, votes=3, alpha=0.5, enter_threshold=0.3, exit_threshold=0.35):
+        self.window = max(window, 1)
+        self.votes = max(min(votes, self.window), 1)
+        self.alpha = alpha
+        self.enter_threshold = enter_threshold
+        self.exit_threshold = max(exit_threshold, enter_threshold)
+        self.class_thresholds = None
+        self.ring = array("H", [0 for _ in range(self.window)])
+        self.counts = {0: self.window}
+        self.head = 0
+        self.class_num = 0
+        self.distance = 1.0
+
+    def reset(self):
+        for i in range(self.window):
+            self.ring[i] = 0
+        self.counts = {0: self.window}
+        self.head = 0
+        self.class_num = 0
+        self.distance = 1.0
+
+    def _enter_threshold(self, class_num):
+        thresholds = self.class_thresholds
+        if thresholds is None or class_num >= len(thresholds):
+            return self.enter_threshold
+        return min(self.enter_threshold, thresholds[class_num])
+
+    def update(self, best_class, best_dist, second_class=0, second_dist=1.0):
+        # returns (decided class or 0, its smoothed distance or the frame's nearest distance)
+        vote = best_class if best_dist <= self._enter_threshold(best_class) else 0
+        counts = self.counts
+        old = self.ring[self.head]
+        counts[old] -= 1
+        if counts[old] == 0:
+            del counts[old]
+        counts[vote] = counts.get(vote, 0) + 1
+        self.ring[self.head] = vote
+        self.head = (self.head + 1) % self.window
+
+        class_num = self.class_num
+        if vote != 0 and vote != class_num and counts[vote] >= self.votes:
+            self.class_num = vote
+            self.distance = best_dist
+        elif class_num != 0:
+            # a class that is not among the two nearest is at least as far as the second one
+            if class_num == best_class:
+                dist = best_dist
+            elif class_num == second_class:
+                dist = second_dist
+            else:
+                dist = max(second_dist, best_dist)
+            self.distance = (1 - self.alpha) * self.distance + self.alpha * min(dist, 1.0)
+            exit_threshold = self.exit_threshold
+            if self.class_thresholds is not None:
+                exit_threshold += self._enter_threshold(class_num) - self.enter_threshold
+            if self.distance > exit_threshold:
+                self.class_num = 0
+
+        if self.class_num == 0:
+            self.distance = min(best_dist, 1.0)
+        return self.class_num, self.distance
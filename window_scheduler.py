@@ -0,0 +1,130 @@
+# Copyright 2020 Isao Sonobe
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+import time
+
+
+NO_MATCH = 10.0
+
+
+def grid_windows(columns, rows, size, width=320, height=240):
+    # size x size windows evenly spread over a width x height frame, row by row
+    windows = []
+    for r in range(rows):
+        y = (height - size) * r // (rows - 1) if rows > 1 else (height - size) // 2
+        for c in range(columns):
+            x = (width - size) * c // (columns - 1) if columns > 1 else (width - size) // 2
+            windows.append((x, y, size, size))
+    return windows
+
+
+class WindowScheduler(object):
+    # Recognition on several windows (x, y, w, h) of the camera frame.
+    # select() returns the windows to evaluate in this frame: all of them without a target frame
+    # rate, otherwise as many as fit in 1000 / target_fps ms given the measured time of a window
+    # and of the rest of the frame, at least one. They are taken in rotation, except that the
+    # window of the current best match (within `follow_threshold`) is evaluated in every frame, so
+    # that a found object is followed. Each window keeps its latest match (update()); result()
+    # aggregates them by best distance, so the decision covers every window once per rotation.
+    def __init__(self, windows, target_fps=0, follow_threshold=0.5):
+        n = len(windows)
+        self.windows = windows
+        self.target_us = 1000000 // target_fps if target_fps > 0 else 0
+        self.follow_threshold = follow_threshold
+        self.classes = array("H", [0 for _ in range(n)])
+        self.dists = array("f", [NO_MATCH for _ in range(n)])
+        self.runner_ups = array("H", [0 for _ in range(n)])
+        self.runner_up_dists = array("f", [NO_MATCH for _ in range(n)])
+        self.next = 0
+        self.per_frame = n
+        self.window_us = 0  # average time of a window
+        self.other_us = 0  # average time of the rest of a frame
+        self._start = 0
+        self._count = 0
+        self._done = None
+
+    def select(self):
+        now = time.ticks_us()
+        if self._done is not None:
+            self.other_us = _average(self.other_us, time.ticks_diff(now, self._done))
+        self._start = now
+
+        n = len(self.windows)
+        count = n
+        if self.target_us > 0 and self.window_us > 0:
+            count = max(1, min(n, (self.target_us - self.other_us) // self.window_us))
+        self.per_frame = count
+
+        selected = []
+        best = self.best_window()
+        if best >= 0 and self.dists[best] <= self.follow_threshold:
+            selected.append(best)
+        while len(selected) < count:
+            i = self.next
+            self.next = (i + 1) % n
+            if i not in selected:
+                selected.append(i)
+        self._count = len(selected)
+        return selected
+
+    def done(self):
+        # after the windows returned by select() were evaluated
+        now = time.ticks_us()
+        self.window_us = _average(self.window_us, time.ticks_diff(now, self._start) // max(self._count, 1))
+        self._done = now
+
+    def skip(self):
+        # a frame without recognition (static scene) is not counted in the time of the rest
+        self._done = None
+
+    def update(self, i, nearest, nearest_dist, runner_up, runner_up_dist):
+        self.classes[i] = nearest
+        self.dists[i] = nearest_dist if nearest > 0 else NO_MATCH
+        self.runner_ups[i] = runner_up
+        self.runner_up_dists[i] = runner_up_dist if runner_up > 0 else NO_MATCH
+
+    def best_window(self, class_num=0):
+        # the window of the best match (of class_num if given), or -1
+        best = -1
+        for i in range(len(self.windows)):
+            c = self.classes[i]
+            if c > 0 and (class_num == 0 or c == class_num) and (best < 0 or self.dists[i] < self.dists[best]):
+                best = i
+        return best
+
+    def result(self):
+        # (nearest class, distance, runner-up class, distance) over the latest matches of all windows
+        best = self.best_window()
+        if best < 0:
+            return 0, NO_MATCH, 0, NO_MATCH
+        class_num = self.classes[best]
+        runner_up = 0
+        runner_up_dist = NO_MATCH
+        for i in range(len(self.windows)):
+            for c, d in ((self.classes[i], self.dists[i]), (self.runner_ups[i], self.runner_up_dists[i])):
+                if c > 0 and c != class_num and d < runner_up_dist:
+                    runner_up = c
+                    runner_up_dist = d
+        return class_num, self.dists[best], runner_up, runner_up_dist
+
+    def region(self, class_num):
+        # 1 + the index of the window where class_num matched best, 0 if it did not
+        return self.best_window(class_num) + 1 if class_num > 0 else 0
+
+
+def _average(average, value):
+    if average == 0:
+        return value
+    return average + (value - average) // 4